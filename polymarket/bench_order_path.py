@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Signal-to-wire benchmark: legacy create_order path vs OrderFactory (never posts anything).
+
+"Wire" = a signed order ready to hand to post_order. Four paths are timed per token:
+  legacy     fresh ClobClient per run, OrderArgs + client.create_order (cold tick/neg-risk/fee lookups)
+  legacy_hot same, but on a client whose lookup caches are already warm
+  factory    OrderFactory.sign on a prepared template (hash + sign only)
+  presigned  OrderFactory.take_exit on a pre-signed exit ladder (dict lookup)
+
+Usage: python3 bench_order_path.py <token_id> [iterations]
+Uses POLYGON_WALLET_PRIVATE_KEY if set, otherwise a throwaway key (signing is local either way).
+"""
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from eth_account import Account
+from py_clob_client.client import ClobClient
+from py_clob_client.clob_types import OrderArgs
+
+from order_factory import OrderFactory
+from order_gateway import pct
+
+load_dotenv('/opt/polybot/.env')
+HOST = 'https://clob.polymarket.com'
+CHAIN = 137
+
+
+def new_client(pk):
+    return ClobClient(HOST, key=pk, chain_id=CHAIN, signature_type=0, funder=Account.from_key(pk).address)
+
+
+def timed(fn, n):
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def row(name, ms):
+    print(f"{name:<11} n={len(ms):<4} p50={pct(ms, 0.50):8.3f}ms  p95={pct(ms, 0.95):8.3f}ms  max={max(ms):8.3f}ms")
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+    token_id = sys.argv[1]
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    pk = os.getenv('POLYGON_WALLET_PRIVATE_KEY') or Account.create().key.hex()
+    price, size = 0.5, 10.0
+
+    cold = timed(lambda: new_client(pk).create_order(OrderArgs(price=price, size=size, side='BUY', token_id=token_id)), min(n, 10))
+
+    hot_client = new_client(pk)
+    hot_client.create_order(OrderArgs(price=price, size=size, side='BUY', token_id=token_id))
+    hot = timed(lambda: hot_client.create_order(OrderArgs(price=price, size=size, side='BUY', token_id=token_id)), n)
+
+    factory = OrderFactory(new_client(pk))
+    factory.prepare(token_id)
+    fac = timed(lambda: factory.sign(token_id, 'BUY', price, size), n)
+
+    def take():
+        factory.take_exit(token_id, 0.52, size)
+
+    pre = []
+    for _ in range(n):
+        factory.presign_exits(token_id, size, price, 0.02, 0.04)
+        pre.extend(timed(take, 1))
+    factory.shutdown()
+
+    print(f"token={token_id[:16]}... iterations={n}")
+    row('legacy', cold)
+    row('legacy_hot', hot)
+    row('factory', fac)
+    row('presigned', pre)
+    print(f"speedup vs legacy: factory x{pct(cold, 0.5) / pct(fac, 0.5):.0f}, presigned x{pct(cold, 0.5) / pct(pre, 0.5):.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,11 @@
 #!/usr/bin/env python3
-"""Read-only BTC book snapshot collector for preflight numerics (no trading)."""
+"""Read-only BTC book snapshot collector for preflight numerics (no trading).
+
+`BookSnapshotter` is the long-lived form: one client, the Gamma market list cached for
+MARKETS_TTL_SEC, books cached for BOOK_TTL_SEC (refreshed in one batched /books call) and
+last-trade watermarks streamed from the market channel, so `snapshot()` on a warm instance
+is in-memory work. The CLI prints one snapshot.
+"""
 import os
 import json
 import time
@@ -9,13 +15,17 @@ from typing import Any, Dict, List, Tuple
 from dotenv import load_dotenv
 from eth_account import Account
 from py_clob_client.client import ClobClient
-from py_clob_client.clob_types import TradeParams
+from py_clob_client.clob_types import BookParams
+
+from trade_watermark import TradeWatermarks
 
 load_dotenv('/opt/polybot/.env')
 PK = os.getenv('POLYGON_WALLET_PRIVATE_KEY')
 HOST = 'https://clob.polymarket.com'
 CHAIN = 137
 GAMMA = 'https://gamma-api.polymarket.com'
+MARKETS_TTL_SEC = float(os.getenv('SNAPSHOT_MARKETS_TTL_SEC', '300'))
+BOOK_TTL_SEC = float(os.getenv('SNAPSHOT_BOOK_TTL_SEC', '2'))
 
 
 def get_client() -> Tuple[ClobClient, str]:
@@ -60,8 +70,13 @@ def parse_tokens(m: Dict[str, Any]) -> List[str]:
     return list(raw)
 
 
+def best_first(levels, side: str = 'bid'):
+    # /book returns bids ascending and asks descending: best level is last, not first
+    return sorted(levels or [], key=lambda lv: float(lv.price), reverse=(side == 'bid'))
+
+
 def depth_3ticks(levels, tick: float = 0.01, side: str = 'bid') -> float:
-    # Sum size within 3 ticks of best level.
+    # Sum size within 3 ticks of best level (levels best-first).
     if not levels:
         return 0.0
     best_px = float(levels[0].price)
@@ -78,56 +93,87 @@ def depth_3ticks(levels, tick: float = 0.01, side: str = 'bid') -> float:
     return total
 
 
-def last_trade_ts(c: ClobClient, token_id: str) -> int:
-    try:
-        trades = c.get_trades(TradeParams(asset_id=str(token_id), after=int(time.time()) - 6 * 3600))
-        if not isinstance(trades, list) or not trades:
-            return 0
-        mt = 0
-        for t in trades:
-            try:
-                mt = max(mt, int(t.get('match_time') or 0))
-            except Exception:
-                pass
-        return mt
-    except Exception:
-        return 0
+class BookSnapshotter:
+    def __init__(self, client: ClobClient = None, market_limit: int = None):
+        self.client = client or get_client()[0]
+        self.market_limit = market_limit or int(os.getenv('BTC_MARKET_LIMIT', '3'))
+        self.candidates: List[Tuple[str, str]] = []  # (question, token_id)
+        self.markets_at = 0.0
+        self.books: Dict[str, Any] = {}  # token_id -> OrderBookSummary
+        self.books_at = 0.0
+        self.last: Dict[str, Any] = None  # most recent snapshot()
+        self.trades = TradeWatermarks()
+
+    def start_stream(self) -> None:
+        """Keep last-trade watermarks current from last_trade_price events (background thread)."""
+        self.trades.subscribe([tid for _, tid in self.refresh_markets()])
+        self.trades.start_thread()
+
+    def refresh_markets(self, force: bool = False) -> List[Tuple[str, str]]:
+        if force or not self.candidates or time.time() - self.markets_at > MARKETS_TTL_SEC:
+            cands = []
+            for m in find_btc_markets(limit=self.market_limit):
+                q = (m.get('question') or '')[:120]
+                cands.extend((q, str(tid)) for tid in parse_tokens(m)[:2])
+            self.candidates = cands
+            self.markets_at = time.time()
+            self.trades.subscribe([tid for _, tid in cands])
+        return self.candidates
+
+    def refresh_books(self, force: bool = False) -> None:
+        if not force and self.books and time.time() - self.books_at <= BOOK_TTL_SEC:
+            return
+        tids = [tid for _, tid in self.candidates]
+        if not tids:
+            return
+        books = self.client.get_order_books([BookParams(token_id=tid) for tid in tids])
+        self.books = {str(b.asset_id): b for b in books}
+        self.books_at = time.time()
+
+    def row(self, q: str, tid: str) -> Dict[str, Any]:
+        ob = self.books.get(tid)
+        if ob is None:
+            return {'question': q, 'token_id': tid, 'error': 'book not returned'}
+        bids = best_first(getattr(ob, 'bids', None), 'bid')
+        asks = best_first(getattr(ob, 'asks', None), 'ask')
+        return {
+            'question': q,
+            'token_id': tid,
+            'best_bid_price': float(bids[0].price) if bids else 0.0,
+            'best_bid_size': float(bids[0].size) if bids else 0.0,
+            'best_ask_price': float(asks[0].price) if asks else 0.0,
+            'best_ask_size': float(asks[0].size) if asks else 0.0,
+            'depth_3ticks_bid': depth_3ticks(bids, side='bid'),
+            'depth_3ticks_ask': depth_3ticks(asks, side='ask'),
+            'last_trade_ts': self.trades.last_trade_ts(self.client, tid),
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        self.refresh_markets()
+        try:
+            self.refresh_books()
+            rows = [self.row(q, tid) for q, tid in self.candidates]
+        except Exception as e:
+            rows = [{'question': q, 'token_id': tid, 'error': str(e)} for q, tid in self.candidates]
+        self.last = {'ts': int(time.time()), 'rows': rows}
+        return self.last
+
+
+_default: BookSnapshotter = None
+
+
+def get_snapshotter() -> BookSnapshotter:
+    """Process-wide snapshotter (client + caches + trade stream started on first use)."""
+    global _default
+    if _default is None:
+        _default = BookSnapshotter()
+        _default.start_stream()
+    return _default
 
 
 def snapshot() -> Dict[str, Any]:
-    c, _ = get_client()
-    mkts = find_btc_markets(limit=int(os.getenv('BTC_MARKET_LIMIT', '3')))
-    rows = []
-    for m in mkts:
-        q = (m.get('question') or '')
-        tokens = parse_tokens(m)
-        for tid in tokens[:2]:
-            try:
-                ob = c.get_order_book(str(tid))
-                bids = getattr(ob, 'bids', []) or []
-                asks = getattr(ob, 'asks', []) or []
-                bbp = float(bids[0].price) if bids else 0.0
-                bbs = float(bids[0].size) if bids else 0.0
-                bap = float(asks[0].price) if asks else 0.0
-                bas = float(asks[0].size) if asks else 0.0
-                d3b = depth_3ticks(bids, side='bid')
-                d3a = depth_3ticks(asks, side='ask')
-                lts = last_trade_ts(c, str(tid))
-                rows.append({
-                    'question': q[:120],
-                    'token_id': str(tid),
-                    'best_bid_price': bbp,
-                    'best_bid_size': bbs,
-                    'best_ask_price': bap,
-                    'best_ask_size': bas,
-                    'depth_3ticks_bid': d3b,
-                    'depth_3ticks_ask': d3a,
-                    'last_trade_ts': lts,
-                })
-            except Exception as e:
-                rows.append({'question': q[:120], 'token_id': str(tid), 'error': str(e)})
-    return {'ts': int(time.time()), 'rows': rows}
+    return get_snapshotter().snapshot()
 
 
 if __name__ == '__main__':
-    print(json.dumps(snapshot(), indent=2))
+    print(json.dumps(BookSnapshotter().snapshot(), indent=2))
@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 import os
+import sys
 import time
 import sqlite3
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
@@ -10,14 +11,72 @@ from eth_account import Account
 from py_clob_client.client import ClobClient
 from py_clob_client.clob_types import BalanceAllowanceParams, AssetType, TradeParams
 
+# shared polybot modules live one level up in the repo (side by side on the VPS)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    from fill_stream import FillStream
+except Exception:
+    FillStream = None
+try:
+    from mark_stream import MarkStream
+except Exception:
+    MarkStream = None
+from sqlite_store import GroupCommit, connect, incremental_vacuum, use_incremental_vacuum
+
 DB_PATH = os.getenv("EQUITY_DB_PATH", "/opt/polybot/rag/equity_terminal.db")
 CADENCE_SEC = float(os.getenv("EQUITY_CADENCE_SEC", "2"))
 CHAIN_ID = 137
 HOST = "https://clob.polymarket.com"
 ET = ZoneInfo("America/New_York")
+# with the user channel up, trade history is only re-read when a fill/order event arrived (or this long passed)
+TRADES_REFRESH_SEC = float(os.getenv("EQUITY_TRADES_REFRESH_SEC", "60"))
+AUTH_BACKOFF_MAX_SEC = float(os.getenv("EQUITY_AUTH_BACKOFF_MAX_SEC", "60"))
+LEDGER_BOOTSTRAP_SEC = 14 * 24 * 3600  # history replayed the first time the ledger is built
+# per-asset balance + mark lookups run concurrently; a call slower than this falls back to the last known value
+FETCH_CONCURRENCY = int(os.getenv("EQUITY_FETCH_CONCURRENCY", "8"))
+CALL_TIMEOUT_SEC = float(os.getenv("EQUITY_CALL_TIMEOUT_SEC", "1.5"))
+
+_pool = ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY, thread_name_prefix="equity")
+_last_marks = {}  # asset_id -> last good mark
+_last_balances = {}  # asset_id -> last good conditional balance
+# last inventory read: USDC, {asset_id: (qty, avg cost)}, and the health of that read
+_inventory = {"usdc": 0.0, "positions": {}, "rest_marked": set(), "realized": 0.0, "last_trade_ts": None, "stale": 1, "api_ok": 0}
+
+# rest: marks polled with the inventory every CADENCE_SEC. stream: marks from the market channel,
+# equity re-valued on every mark move (REST marks only for tokens the stream has nothing for)
+MARK_MODE = os.getenv("EQUITY_MARK_MODE", "rest")
+MARK_SOURCE = os.getenv("EQUITY_MARK_SOURCE", "mid")  # mid | last
+MARK_WRITE_MIN_SEC = float(os.getenv("EQUITY_MARK_WRITE_MIN_SEC", "0.25"))
+# mark-driven snapshots are committed in batches; every inventory tick commits
+COMMIT_MAX_SEC = float(os.getenv("EQUITY_COMMIT_MAX_SEC", "1.0"))
+ROLLUP_SEC = (60, 300, 3600)  # 1m / 5m / 1h OHLC buckets kept next to the raw snapshots
+# retention: raw snapshots and fine rollups age out (coarser rollups still cover them); 1h rollups are kept
+RAW_RETENTION_DAYS = max(1.0, float(os.getenv("EQUITY_RAW_RETENTION_DAYS", "7")))
+ROLLUP_RETENTION_DAYS = {
+    60: max(1.0, float(os.getenv("EQUITY_1M_RETENTION_DAYS", "30"))),
+    300: max(7.0, float(os.getenv("EQUITY_5M_RETENTION_DAYS", "365"))),
+}
+MAINTENANCE_SEC = float(os.getenv("EQUITY_MAINTENANCE_SEC", "600"))
+PURGE_BATCH = 5000  # rows per delete transaction, so readers and the writer never wait long
+VACUUM_PAGES = int(os.getenv("EQUITY_VACUUM_PAGES", "2000"))
+
+ROLLUP_UPSERT = """
+INSERT INTO equity_rollups (
+  resolution_sec, bucket_ts, open_usd, high_usd, low_usd, close_usd, realized_pnl_usd, unrealized_pnl_usd, stale_data, n
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+ON CONFLICT (resolution_sec, bucket_ts) DO UPDATE SET
+  high_usd = max(high_usd, excluded.high_usd),
+  low_usd = min(low_usd, excluded.low_usd),
+  close_usd = excluded.close_usd,
+  realized_pnl_usd = excluded.realized_pnl_usd,
+  unrealized_pnl_usd = excluded.unrealized_pnl_usd,
+  stale_data = max(stale_data, excluded.stale_data),
+  n = n + 1
+"""
 
 
 def db_init(conn):
+    use_incremental_vacuum(conn)
     c = conn.cursor()
     c.execute(
         """
@@ -37,9 +96,109 @@ def db_init(conn):
         )
         """
     )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_equity_snapshots_ts ON equity_snapshots (ts_utc)")
+    # average-cost ledger, advanced incrementally from trades after the match_time watermark
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS trade_ledger (
+          asset_id TEXT PRIMARY KEY,
+          qty REAL NOT NULL,
+          cost REAL NOT NULL,
+          realized_pnl REAL NOT NULL
+        )
+        """
+    )
+    c.execute("CREATE TABLE IF NOT EXISTS trade_ledger_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    # trade ids at/near the watermark, so a re-fetch from the watermark second never double-applies
+    c.execute("CREATE TABLE IF NOT EXISTS trade_ledger_applied (trade_id TEXT PRIMARY KEY, match_time INTEGER NOT NULL)")
+    # OHLC of equity per bucket, upserted as each snapshot lands (close/PnL = last in bucket)
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS equity_rollups (
+          resolution_sec INTEGER NOT NULL,
+          bucket_ts INTEGER NOT NULL,
+          open_usd REAL NOT NULL,
+          high_usd REAL NOT NULL,
+          low_usd REAL NOT NULL,
+          close_usd REAL NOT NULL,
+          realized_pnl_usd REAL,
+          unrealized_pnl_usd REAL,
+          stale_data INTEGER,
+          n INTEGER NOT NULL,
+          PRIMARY KEY (resolution_sec, bucket_ts)
+        ) WITHOUT ROWID
+        """
+    )
+    if c.execute("SELECT 1 FROM equity_rollups LIMIT 1").fetchone() is None:
+        backfill_rollups(conn)
     conn.commit()
 
 
+def rollup_rows(ts, snap):
+    return [
+        (
+            res, ts - ts % res, snap["equity_total_usd"], snap["equity_total_usd"], snap["equity_total_usd"],
+            snap["equity_total_usd"], snap["realized_pnl_usd"], snap["unrealized_pnl_usd"], snap["stale_data"],
+        )
+        for res in ROLLUP_SEC
+    ]
+
+
+def backfill_rollups(conn):
+    """Build the rollups from snapshots written before they existed (one pass, oldest first)."""
+    rows = conn.execute(
+        "SELECT ts_utc, equity_total_usd, realized_pnl_usd, unrealized_pnl_usd, stale_data FROM equity_snapshots ORDER BY id"
+    )
+    buckets = {}
+    for ts, eq, rpnl, upnl, stale in rows:
+        for res in ROLLUP_SEC:
+            key = (res, ts - ts % res)
+            b = buckets.get(key)
+            if b is None:
+                buckets[key] = [eq, eq, eq, eq, rpnl, upnl, stale or 0, 1]
+            else:
+                b[1] = max(b[1], eq)
+                b[2] = min(b[2], eq)
+                b[3], b[4], b[5] = eq, rpnl, upnl
+                b[6] = max(b[6], stale or 0)
+                b[7] += 1
+    conn.executemany(
+        """
+        INSERT INTO equity_rollups (
+          resolution_sec, bucket_ts, open_usd, high_usd, low_usd, close_usd, realized_pnl_usd, unrealized_pnl_usd, stale_data, n
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [(res, bucket, *b) for (res, bucket), b in buckets.items()],
+    )
+
+
+def purge(conn, table, key, where, args):
+    """Delete rows of `table` matching `where` in PURGE_BATCH-row transactions. Returns rows deleted."""
+    sql = f"DELETE FROM {table} WHERE ({key}) IN (SELECT {key} FROM {table} WHERE {where} LIMIT {PURGE_BATCH})"
+    total = 0
+    while True:
+        with conn:
+            n = conn.execute(sql, args).rowcount
+        total += n
+        if n < PURGE_BATCH:
+            return total
+
+
+def maintain(conn):
+    """Retention + incremental vacuum: keeps the file bounded under continuous collection."""
+    now = int(time.time())
+    raw = purge(conn, "equity_snapshots", "id", "ts_utc < ?", (now - int(RAW_RETENTION_DAYS * 86400),))
+    rolled = 0
+    for res, days in ROLLUP_RETENTION_DAYS.items():
+        rolled += purge(
+            conn, "equity_rollups", "resolution_sec, bucket_ts", "resolution_sec = ? AND bucket_ts < ?",
+            (res, now - int(days * 86400)),
+        )
+    incremental_vacuum(conn, VACUUM_PAGES)
+    if raw or rolled:
+        print(f"retention: purged {raw} snapshots, {rolled} rollup buckets")
+
+
 def get_client():
     load_dotenv("/opt/polybot/.env")
     pk = os.getenv("POLYGON_WALLET_PRIVATE_KEY")
@@ -49,148 +208,368 @@ def get_client():
     return c, wallet
 
 
-def get_total_equity(client, wallet):
-    t0 = time.time()
-    stale = 0
-    api_ok = 1
-    last_trade_ts = None
+def is_auth_error(e):
+    status = getattr(e, "status_code", None)
+    msg = str(e).lower()
+    return status in (401, 403) or "unauthorized" in msg or "invalid api key" in msg
 
-    # collateral (USDC)
-    params_c = BalanceAllowanceParams(asset_type=AssetType.COLLATERAL, token_id="", signature_type=0)
-    coll = client.get_balance_allowance(params_c)
-    usdc = int(coll.get("balance", "0")) / 1e6
 
-    # build open inventory from trades (authoritative flow) then validate with balance endpoint
-    trades = client.get_trades(TradeParams(maker_address=wallet, after=int(time.time()) - 14 * 24 * 3600))
-    if not isinstance(trades, list):
-        trades = []
+class ClientHolder:
+    """One authenticated client for the life of the collector (py_clob_client keeps a pooled
+    HTTP/2 connection underneath). Rebuilt only after an auth failure, with exponential backoff."""
 
-    lots = defaultdict(lambda: {"qty": 0.0, "cost": 0.0})
-    realized = 0.0
-    for t in sorted(trades, key=lambda x: int(x.get("match_time") or 0)):
-        try:
-            aid = str(t.get("asset_id"))
-            side = (t.get("side") or "").upper()
-            q = float(t.get("size") or 0)
-            p = float(t.get("price") or 0)
-            mt = int(t.get("match_time") or 0)
-            if mt and (last_trade_ts is None or mt > last_trade_ts):
-                last_trade_ts = mt
+    def __init__(self):
+        self.client = None
+        self.wallet = None
+        self.failures = 0
+        self.retry_at = 0.0
+        self.rebuilds = 0
+
+    def get(self):
+        if self.client is None:
+            if time.time() < self.retry_at:
+                raise RuntimeError(f"client rebuild backing off ({self.retry_at - time.time():.0f}s)")
+            try:
+                self.client, self.wallet = get_client()
+            except Exception:
+                self._backoff()
+                raise
+            self.rebuilds += 1
+        return self.client, self.wallet
+
+    def _backoff(self):
+        self.failures += 1
+        self.retry_at = time.time() + min(AUTH_BACKOFF_MAX_SEC, 2 ** self.failures)
+
+    def on_success(self):
+        self.failures = 0
+
+    def on_error(self, e):
+        # transient network errors keep the client; only bad credentials force a rebuild
+        if is_auth_error(e):
+            self.client = None
+            self._backoff()
+
+
+class TradeLedger:
+    """Persisted per-asset qty / cost / realized PnL plus a match_time watermark.
+
+    Each refresh fetches only trades at or after the watermark and applies the new ones, so
+    cost follows new fills rather than history. With the user channel up, the fetch is
+    skipped entirely until a fill/order event arrives (or TRADES_REFRESH_SEC passes).
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lots = {}
+        for aid, qty, cost, rpnl in conn.execute("SELECT asset_id, qty, cost, realized_pnl FROM trade_ledger"):
+            self.lots[aid] = {"qty": qty, "cost": cost, "realized": rpnl}
+        row = conn.execute("SELECT value FROM trade_ledger_meta WHERE key = 'watermark'").fetchone()
+        self.watermark = row[0] if row else 0
+        self.checked_version = None
+        self.checked_at = 0.0
+
+    def realized(self):
+        return sum(p["realized"] for p in self.lots.values())
+
+    def refresh(self, client, wallet, fills=None):
+        now = time.time()
+        if (
+            fills is not None
+            and fills.connected
+            and fills.version == self.checked_version
+            and now - self.checked_at < TRADES_REFRESH_SEC
+        ):
+            return 0
+        version = fills.version if fills is not None else None
+        after = self.watermark or int(now) - LEDGER_BOOTSTRAP_SEC
+        trades = client.get_trades(TradeParams(maker_address=wallet, after=after))
+        applied = self.apply(trades if isinstance(trades, list) else [])
+        self.checked_version = version
+        self.checked_at = now
+        return applied
+
+    def apply(self, trades):
+        seen = set()
+        ids = [str(t.get("id") or "") for t in trades]
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            seen.update(r[0] for r in self.conn.execute(
+                f"SELECT trade_id FROM trade_ledger_applied WHERE trade_id IN ({','.join('?' * len(chunk))})", chunk))
+        fresh = [t for t, tid in zip(trades, ids) if tid and tid not in seen]
+        if not fresh:
+            return 0
+
+        changed = set()
+        applied_rows = []
+        for t in sorted(fresh, key=lambda x: int(x.get("match_time") or 0)):
+            try:
+                aid = str(t.get("asset_id"))
+                side = (t.get("side") or "").upper()
+                q = float(t.get("size") or 0)
+                p = float(t.get("price") or 0)
+                mt = int(t.get("match_time") or 0)
+            except Exception:
+                continue
+            applied_rows.append((str(t.get("id")), mt))
+            self.watermark = max(self.watermark, mt)
             if q <= 0:
                 continue
+            lot = self.lots.setdefault(aid, {"qty": 0.0, "cost": 0.0, "realized": 0.0})
             if side == "BUY":
-                lots[aid]["qty"] += q
-                lots[aid]["cost"] += q * p
+                lot["qty"] += q
+                lot["cost"] += q * p
             elif side == "SELL":
-                have = lots[aid]["qty"]
+                have = lot["qty"]
                 if have <= 1e-9:
                     continue
-                avg = lots[aid]["cost"] / have
+                avg = lot["cost"] / have
                 close_q = min(have, q)
-                realized += (p - avg) * close_q
-                lots[aid]["qty"] -= close_q
-                lots[aid]["cost"] -= avg * close_q
-                if lots[aid]["qty"] < 1e-9:
-                    lots[aid] = {"qty": 0.0, "cost": 0.0}
-        except Exception:
-            continue
+                lot["realized"] += (p - avg) * close_q
+                lot["qty"] -= close_q
+                lot["cost"] -= avg * close_q
+                if lot["qty"] < 1e-9:
+                    lot["qty"] = lot["cost"] = 0.0
+            changed.add(aid)
 
-    unreal = 0.0
-    open_exposure = 0.0
-    for aid, pos in lots.items():
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO trade_ledger (asset_id, qty, cost, realized_pnl) VALUES (?, ?, ?, ?)",
+                [(aid, self.lots[aid]["qty"], self.lots[aid]["cost"], self.lots[aid]["realized"]) for aid in changed],
+            )
+            self.conn.executemany("INSERT OR IGNORE INTO trade_ledger_applied (trade_id, match_time) VALUES (?, ?)", applied_rows)
+            self.conn.execute("INSERT OR REPLACE INTO trade_ledger_meta (key, value) VALUES ('watermark', ?)", (self.watermark,))
+            # only ids near the watermark can come back in a later fetch
+            self.conn.execute("DELETE FROM trade_ledger_applied WHERE match_time < ?", (self.watermark - 3600,))
+        return len(applied_rows)
+
+
+def fetch_balance(client, token_id):
+    if token_id:
+        params = BalanceAllowanceParams(asset_type=AssetType.CONDITIONAL, token_id=token_id, signature_type=0)
+    else:
+        params = BalanceAllowanceParams(asset_type=AssetType.COLLATERAL, token_id="", signature_type=0)
+    return int(client.get_balance_allowance(params).get("balance", "0")) / 1e6
+
+
+def fetch_mark(client, token_id):
+    lp = client.get_last_trade_price(token_id)
+    return float(lp.get("price") if isinstance(lp, dict) else lp)
+
+
+def settle(fut, deadline):
+    """(value, timed_out, error) for a pool future, waiting no later than `deadline`."""
+    try:
+        return fut.result(timeout=max(0.0, deadline - time.time())), False, None
+    except FutureTimeout:
+        return None, True, None
+    except Exception as e:
+        return None, False, e
+
+
+def get_total_equity(client, wallet, ledger, fills=None, marks=None):
+    """Refresh inventory (USDC, ledger, balances) over REST and mark it. Tokens the mark stream
+    already covers skip the REST mark lookup."""
+    t0 = time.time()
+    stale = 0
+    api_ok = 1
+
+    # collateral (USDC), in flight while the ledger catches up
+    usdc_fut = _pool.submit(fetch_balance, client, "")
+
+    # open inventory from the incremental trade ledger (authoritative flow), then validated with balance endpoint
+    ledger.refresh(client, wallet, fills)
+    lots = ledger.lots
+    realized = ledger.realized()
+    last_trade_ts = ledger.watermark or None
+
+    # every open asset's balance + mark at once, all bounded by one deadline
+    held = [aid for aid, pos in lots.items() if pos["qty"] > 1e-9]
+    futs = {
+        aid: (
+            _pool.submit(fetch_balance, client, aid),
+            None if marks is not None and marks.mark(aid) is not None else _pool.submit(fetch_mark, client, aid),
+        )
+        for aid in held
+    }
+    deadline = time.time() + CALL_TIMEOUT_SEC
+    usdc, timed_out, err = settle(usdc_fut, deadline)
+    if err is not None:
+        raise err  # a failed collateral read fails the snapshot, as before
+    if timed_out:
+        usdc = _last_balances.get("")
+        if usdc is None:
+            raise TimeoutError(f"collateral balance slower than {CALL_TIMEOUT_SEC}s with no previous value")
+        stale = 1
+    _last_balances[""] = usdc
+
+    positions = {}
+    rest_marked = set()
+    for aid in held:
+        pos = lots[aid]
         q = pos["qty"]
-        if q <= 1e-9:
-            continue
+        bal_fut, mark_fut = futs[aid]
 
         # authoritative current token balance check
-        try:
-            balp = BalanceAllowanceParams(asset_type=AssetType.CONDITIONAL, token_id=aid, signature_type=0)
-            br = client.get_balance_allowance(balp)
-            q_bal = int(br.get("balance", "0")) / 1e6
+        q_bal, timed_out, err = settle(bal_fut, deadline)
+        if q_bal is None and timed_out:
+            q_bal = _last_balances.get(aid)
+            stale = 1
+        if q_bal is not None:
+            _last_balances[aid] = q_bal
             q = min(q, q_bal)
-        except Exception:
-            pass
 
         if q <= 1e-9:
             continue
 
-        avg = pos["cost"] / pos["qty"] if pos["qty"] > 0 else 0.0
-        try:
-            lp = client.get_last_trade_price(aid)
-            mark = float(lp.get("price") if isinstance(lp, dict) else lp)
-            if mark <= 0:
+        if mark_fut is not None:
+            mark, timed_out, err = settle(mark_fut, deadline)
+            if err is not None:
+                api_ok = 0
+            if mark is not None and mark > 0:
+                _last_marks[aid] = mark
+                rest_marked.add(aid)
+        positions[aid] = (q, pos["cost"] / pos["qty"] if pos["qty"] > 0 else 0.0)
+
+    _inventory.update(
+        usdc=usdc, positions=positions, rest_marked=rest_marked, realized=realized,
+        last_trade_ts=last_trade_ts, stale=stale, api_ok=api_ok,
+    )
+    return mark_to_market(marks, t0)
+
+
+def mark_to_market(marks=None, t0=None):
+    """Equity from the last inventory read and current marks: stream mark first, then the last
+    REST mark (stale unless fetched on the last inventory read), then entry price. No I/O."""
+    inv = _inventory
+    stale = inv["stale"]
+    unreal = 0.0
+    open_exposure = 0.0
+    for aid, (q, avg) in inv["positions"].items():
+        mark = marks.mark(aid) if marks is not None else None
+        if mark is None:
+            mark = _last_marks.get(aid)
+            if mark is None or aid not in inv["rest_marked"]:
                 stale = 1
+            if mark is None:
                 mark = avg
-        except Exception:
-            api_ok = 0
-            stale = 1
-            mark = avg
-
         open_exposure += q * mark
         unreal += (mark - avg) * q
 
-    equity = usdc + open_exposure
-    latency_ms = int((time.time() - t0) * 1000)
+    equity = inv["usdc"] + open_exposure
+    latency_ms = int((time.time() - t0) * 1000) if t0 else 0
     return {
         "equity_total_usd": equity,
-        "realized_pnl_usd": realized,
+        "realized_pnl_usd": inv["realized"],
         "unrealized_pnl_usd": unreal,
         "open_exposure_usd": open_exposure,
         "latency_ms": latency_ms,
-        "api_ok": api_ok,
-        "last_trade_ts": last_trade_ts,
+        "api_ok": inv["api_ok"],
+        "last_trade_ts": inv["last_trade_ts"],
         "stale_data": stale,
     }
 
 
+def write_snapshot(writer, snap):
+    ts = int(time.time())
+    et = datetime.fromtimestamp(ts, timezone.utc).astimezone(ET).strftime("%Y-%m-%d %H:%M:%S %Z")
+    safe_mode = 1 if os.path.exists("/opt/polybot/safe_mode.flag") else 0
+    writer.write(
+        """
+        INSERT INTO equity_snapshots (
+          ts_utc, timestamp_et, equity_total_usd, realized_pnl_usd, unrealized_pnl_usd, open_exposure_usd,
+          latency_ms, api_ok, last_trade_ts, safe_mode, stale_data
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            ts,
+            et,
+            snap["equity_total_usd"],
+            snap["realized_pnl_usd"],
+            snap["unrealized_pnl_usd"],
+            snap["open_exposure_usd"],
+            snap["latency_ms"],
+            snap["api_ok"],
+            snap["last_trade_ts"],
+            safe_mode,
+            snap["stale_data"],
+        ),
+    )
+    for row in rollup_rows(ts, snap):
+        writer.write(ROLLUP_UPSERT, row)
+
+
 def main():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    db_init(conn)
+    conn = connect(DB_PATH, db_init)
+    ledger = TradeLedger(conn)
+    writer = GroupCommit(conn, max_delay_sec=COMMIT_MAX_SEC)
 
+    holder = ClientHolder()
+    fills = None
+    if FillStream is not None:
+        try:
+            client, _ = holder.get()
+            fills = FillStream(client.creds)
+            fills.start_thread()
+        except Exception as e:
+            print(f"fill stream unavailable, polling trades every tick: {e}")
+            fills = None
+
+    marks = None
+    if MARK_MODE == "stream" and MarkStream is not None:
+        marks = MarkStream(MARK_SOURCE)
+        marks.start_thread()
+
+    next_rest = 0.0
+    next_maintenance = 0.0
+    written = None
     while True:
-        ts = int(time.time())
-        et = datetime.fromtimestamp(ts, timezone.utc).astimezone(ET).strftime("%Y-%m-%d %H:%M:%S %Z")
-        safe_mode = 1 if os.path.exists("/opt/polybot/safe_mode.flag") else 0
+        tick = time.time()
+        if tick >= next_maintenance:
+            next_maintenance = tick + MAINTENANCE_SEC
+            writer.flush()
+            try:
+                maintain(conn)
+            except sqlite3.Error as e:
+                print(f"retention failed: {e}")
+        if tick >= next_rest:
+            # inventory read (REST) on the base cadence; also the only mark source in rest mode
+            next_rest = tick + CADENCE_SEC
+            try:
+                client, wallet = holder.get()
+                snap = get_total_equity(client, wallet, ledger, fills, marks)
+                holder.on_success()
+            except Exception as e:
+                holder.on_error(e)
+                snap = {
+                    "equity_total_usd": 0.0,
+                    "realized_pnl_usd": 0.0,
+                    "unrealized_pnl_usd": 0.0,
+                    "open_exposure_usd": 0.0,
+                    "latency_ms": None,
+                    "api_ok": 0,
+                    "last_trade_ts": None,
+                    "stale_data": 1,
+                }
+            if marks is not None:
+                marks.subscribe(_inventory["positions"])
+            write_snapshot(writer, snap)
+            writer.flush()
+            written = snap
+        else:
+            # a mark moved: re-value the last inventory without touching REST
+            snap = mark_to_market(marks, tick)
+            if not written or snap["equity_total_usd"] != written["equity_total_usd"] or snap["stale_data"] != written["stale_data"]:
+                write_snapshot(writer, snap)
+                written = snap
 
-        try:
-            client, wallet = get_client()
-            snap = get_total_equity(client, wallet)
-        except Exception:
-            snap = {
-                "equity_total_usd": 0.0,
-                "realized_pnl_usd": 0.0,
-                "unrealized_pnl_usd": 0.0,
-                "open_exposure_usd": 0.0,
-                "latency_ms": None,
-                "api_ok": 0,
-                "last_trade_ts": None,
-                "stale_data": 1,
-            }
-
-        conn.execute(
-            """
-            INSERT INTO equity_snapshots (
-              ts_utc, timestamp_et, equity_total_usd, realized_pnl_usd, unrealized_pnl_usd, open_exposure_usd,
-              latency_ms, api_ok, last_trade_ts, safe_mode, stale_data
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                ts,
-                et,
-                snap["equity_total_usd"],
-                snap["realized_pnl_usd"],
-                snap["unrealized_pnl_usd"],
-                snap["open_exposure_usd"],
-                snap["latency_ms"],
-                snap["api_ok"],
-                snap["last_trade_ts"],
-                safe_mode,
-                snap["stale_data"],
-            ),
-        )
-        conn.commit()
-        time.sleep(CADENCE_SEC)
+        if marks is None:
+            time.sleep(CADENCE_SEC)
+            continue
+        # coalesce: however fast marks move, write at most once per MARK_WRITE_MIN_SEC
+        time.sleep(max(0.0, MARK_WRITE_MIN_SEC - (time.time() - tick)))
+        marks.changed.wait(timeout=max(0.0, next_rest - time.time()))
+        marks.changed.clear()
 
 
 if __name__ == "__main__":
@@ -1,12 +1,34 @@
 #!/usr/bin/env python3
 import os
+import sys
 import json
 import time
-import sqlite3
-from fastapi import FastAPI
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+from typing import Annotated
+from zoneinfo import ZoneInfo
+import numpy as np
+from fastapi import FastAPI, Query
 from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sqlite_store import query
+
 DB_PATH = os.getenv("EQUITY_DB_PATH", "/opt/polybot/rag/equity_terminal.db")
+ET = ZoneInfo("America/New_York")
+# /history serves the coarsest rollup that still yields this many points over the timeframe
+HISTORY_MIN_POINTS = int(os.getenv("EQUITY_HISTORY_MIN_POINTS", "300"))
+ROLLUP_SEC = (3600, 300, 60)  # coarsest first; maintained by collector.py
+HISTORY_MAX_POINTS = int(os.getenv("EQUITY_HISTORY_MAX_POINTS", "1000"))
+HISTORY_POINTS_LIMIT = int(os.getenv("EQUITY_HISTORY_POINTS_LIMIT", "10000"))  # largest max_points a client may ask for
+# /stream: one poller tails equity_snapshots and fans rows out; new clients get the last STREAM_REPLAY rows
+STREAM_POLL_SEC = float(os.getenv("EQUITY_STREAM_POLL_SEC", "1"))
+STREAM_REPLAY = int(os.getenv("EQUITY_STREAM_REPLAY", "2000"))
+STREAM_QUEUE_MAX = int(os.getenv("EQUITY_STREAM_QUEUE_MAX", "256"))  # unread events beyond the replay before a client is dropped
+# "session" stats start here (unix ts); default: when this server started
+SESSION_START = int(os.getenv("EQUITY_SESSION_START", "0")) or int(time.time())
+STATS_WINDOW_SEC = 24 * 3600
 app = FastAPI()
 
 INDEX = """
@@ -29,48 +51,45 @@ let tf='6h';
 const ctx=document.getElementById('c');
 const chart=new Chart(ctx,{type:'line',data:{labels:[],datasets:[{label:'Equity',data:[],borderColor:'#59a1ff',pointRadius:0,tension:0.18}]},options:{animation:false,responsive:true,plugins:{legend:{display:false},tooltip:{enabled:true}},scales:{x:{ticks:{color:'#8fa4d9'}},y:{ticks:{color:'#8fa4d9'}}}}});
 function fmt(x){return '$'+Number(x).toFixed(2)}
-function pct(a,b){if(!a||a===0)return 0; return ((b-a)/a*100)}
 function setTf(v){tf=v; loadHistory();}
+let rows=[], cap=2000;
 async function loadHistory(){
-  const r=await fetch('/history?tf='+tf); const j=await r.json(); render(j.rows);}
-function render(rows){
-  if(!rows.length)return;
+  const r=await fetch('/history?tf='+tf); const j=await r.json();
+  rows=j.rows; cap=Math.max(2000, rows.length+2000);
   chart.data.labels=rows.map(r=>r.timestamp_et);
   chart.data.datasets[0].data=rows.map(r=>r.equity_total_usd);
   chart.update('none');
-  const cur=rows[rows.length-1].equity_total_usd;
-  const start=rows[0].equity_total_usd;
-  const last24 = rows.find(r=> (rows[rows.length-1].ts_utc - r.ts_utc) <= 86400 ) || rows[0];
-  const d24Base = last24.equity_total_usd;
-  let hwm=rows[0].equity_total_usd, mdd=0;
-  for(const r of rows){hwm=Math.max(hwm,r.equity_total_usd); mdd=Math.min(mdd,(r.equity_total_usd-hwm));}
-  document.getElementById('eq').innerText=fmt(cur);
-  document.getElementById('sess').innerText=`${fmt(cur-start)} (${pct(start,cur).toFixed(2)}%)`;
-  document.getElementById('d24').innerText=`${fmt(cur-d24Base)} (${pct(d24Base,cur).toFixed(2)}%)`;
-  document.getElementById('mdd').innerText=fmt(mdd);
-  document.getElementById('hwm').innerText=fmt(Math.max(...rows.map(r=>r.equity_total_usd)));
-  const st=rows[rows.length-1].stale_data; document.getElementById('stale').innerText=st? 'STALE DATA':'';
+  const s=await fetch('/stats'); cards(await s.json());}
+function cards(s){
+  if(s.current==null)return;
+  document.getElementById('eq').innerText=fmt(s.current);
+  document.getElementById('sess').innerText=`${fmt(s.session_change)} (${s.session_change_pct.toFixed(2)}%)`;
+  document.getElementById('d24').innerText=`${fmt(s.change_24h)} (${s.change_24h_pct.toFixed(2)}%)`;
+  document.getElementById('mdd').innerText=fmt(s.max_drawdown);
+  document.getElementById('hwm').innerText=fmt(s.hwm);
+  document.getElementById('stale').innerText=s.stale_data? 'STALE DATA':'';
 }
 const es=new EventSource('/stream');
-es.onmessage=(ev)=>{const snap=JSON.parse(ev.data); if(!window.buf) window.buf=[]; window.buf.push(snap); if(window.buf.length>2000) window.buf.shift(); render(window.buf);} 
+es.onmessage=(ev)=>{
+  const snap=JSON.parse(ev.data); cards(snap.stats);
+  if(rows.length && snap.ts_utc<=rows[rows.length-1].ts_utc) return;  // already in the loaded history
+  rows.push(snap); chart.data.labels.push(snap.timestamp_et); chart.data.datasets[0].data.push(snap.equity_total_usd);
+  if(rows.length>cap){rows.shift(); chart.data.labels.shift(); chart.data.datasets[0].data.shift();}
+  chart.update('none');}
 loadHistory();
 </script></body></html>
 """
 
 
 def q(sql, args=()):
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
-    rows = con.execute(sql, args).fetchall()
-    con.close()
-    return [dict(r) for r in rows]
+    return query(DB_PATH, sql, args)
 
 @app.get("/", response_class=HTMLResponse)
 def home():
     return INDEX
 
 @app.get("/history")
-def history(tf: str = "6h"):
+def history(tf: str = "6h", max_points: Annotated[int, Query(ge=3, le=HISTORY_POINTS_LIMIT)] = HISTORY_MAX_POINTS):
     now = int(time.time())
     if tf == "1h":
         start = now - 3600
@@ -81,18 +100,243 @@ def history(tf: str = "6h"):
     elif tf == "7d":
         start = now - 7 * 24 * 3600
     else:
-        start = 0
-    rows = q("SELECT ts_utc,timestamp_et,equity_total_usd,stale_data FROM equity_snapshots WHERE ts_utc>=? ORDER BY ts_utc", (start,))
-    return JSONResponse({"rows": rows})
+        # raw snapshots age out (retention); the rollups reach back further
+        first = q(
+            "SELECT min(ts) AS ts FROM (SELECT min(ts_utc) AS ts FROM equity_snapshots UNION ALL SELECT min(bucket_ts) FROM equity_rollups)"
+        )[0]["ts"]
+        start = first or now
+    res = pick_resolution(now - start)
+    if res is None:
+        rows = q("SELECT ts_utc,timestamp_et,equity_total_usd,stale_data FROM equity_snapshots WHERE ts_utc>=? ORDER BY ts_utc", (start,))
+    else:
+        rows = q(
+            """
+            SELECT bucket_ts AS ts_utc, close_usd AS equity_total_usd, open_usd, high_usd, low_usd,
+                   realized_pnl_usd, unrealized_pnl_usd, stale_data
+            FROM equity_rollups WHERE resolution_sec=? AND bucket_ts>=? ORDER BY bucket_ts
+            """,
+            (res, start - start % res),
+        )
+        for r in rows:
+            r["timestamp_et"] = datetime.fromtimestamp(r["ts_utc"], timezone.utc).astimezone(ET).strftime("%Y-%m-%d %H:%M:%S %Z")
+    rows = downsample(rows, max_points)
+    return JSONResponse({"rows": rows, "resolution_sec": res or 0})
 
-@app.get("/stream")
-def stream():
-    def gen():
-        last_id = 0
+
+def pick_resolution(span_sec):
+    """Coarsest rollup with at least HISTORY_MIN_POINTS buckets over `span_sec`; None = raw rows."""
+    for res in ROLLUP_SEC:
+        if span_sec / res >= HISTORY_MIN_POINTS:
+            return res
+    return None
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: indexes of `n_out` points that keep the shape of (x, y)."""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)  # n_out-2 buckets between the fixed endpoints
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            cx, cy = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+
+def downsample(rows, max_points):
+    """At most `max_points` rows: LTTB for shape, plus the max-drawdown trough and peak and the
+    global high/low, which LTTB alone may average away. When the budget is too small for all of
+    them, pins are kept in that order after the 3 points LTTB needs."""
+    if len(rows) <= max_points:
+        return rows
+    y = np.array([r["equity_total_usd"] for r in rows], dtype=float)
+    x = np.array([r["ts_utc"] for r in rows], dtype=float)
+    trough = int(np.argmin(y - np.maximum.accumulate(y)))
+    pinned = []
+    for i in (trough, int(y[: trough + 1].argmax()), int(y.argmax()), int(y.argmin())):
+        if i not in pinned and 0 < i < len(y) - 1:  # LTTB always keeps both endpoints
+            pinned.append(i)
+    pinned = pinned[: max(0, max_points - 3)]
+    keep = np.union1d(lttb(x, y, max_points - len(pinned)), pinned).astype(int)
+    return [rows[i] for i in keep]
+
+
+def pct(a, b):
+    return (b - a) / a * 100 if a else 0.0
+
+
+class EquityStats:
+    """Running equity statistics, updated per snapshot instead of rescanning history: session
+    HWM / max drawdown as running values, 24h change from a time-ordered deque of the window
+    and 24h high/low from monotonic deques (O(1) amortized per snapshot)."""
+
+    def __init__(self, session_start=SESSION_START, window_sec=STATS_WINDOW_SEC):
+        self.session_start = session_start
+        self.window_sec = window_sec
+        self.window = deque()  # (ts, equity), oldest first
+        self.highs = deque()  # decreasing equity: front is the window max
+        self.lows = deque()  # increasing equity: front is the window min
+        self.current = None
+        self.ts = None
+        self.stale_data = 0
+        self.session_base = None
+        self.hwm = None
+        self.max_drawdown = 0.0
+
+    def update(self, ts, equity, stale_data=0):
+        self.window.append((ts, equity))
+        while self.highs and self.highs[-1][1] <= equity:
+            self.highs.pop()
+        self.highs.append((ts, equity))
+        while self.lows and self.lows[-1][1] >= equity:
+            self.lows.pop()
+        self.lows.append((ts, equity))
+        horizon = ts - self.window_sec
+        while self.window[0][0] < horizon:
+            self.window.popleft()
+        while self.highs[0][0] < horizon:
+            self.highs.popleft()
+        while self.lows[0][0] < horizon:
+            self.lows.popleft()
+
+        self.current, self.ts, self.stale_data = equity, ts, stale_data
+        if ts >= self.session_start:
+            if self.session_base is None:
+                self.session_base = self.hwm = equity
+            self.hwm = max(self.hwm, equity)
+            self.max_drawdown = min(self.max_drawdown, equity - self.hwm)
+
+    def summary(self):
+        if self.current is None:
+            return {"current": None}
+        base_24h = self.window[0][1]
+        base = self.session_base if self.session_base is not None else self.current
+        return {
+            "ts_utc": self.ts,
+            "current": self.current,
+            "session_start": self.session_start,
+            "session_change": self.current - base,
+            "session_change_pct": pct(base, self.current),
+            "change_24h": self.current - base_24h,
+            "change_24h_pct": pct(base_24h, self.current),
+            "high_24h": self.highs[0][1],
+            "low_24h": self.lows[0][1],
+            "hwm": self.hwm if self.hwm is not None else self.current,
+            "max_drawdown": self.max_drawdown,
+            "stale_data": self.stale_data,
+        }
+
+
+class Broadcaster:
+    """Single tail of equity_snapshots shared by every /stream client. Each client has a bounded
+    queue; one that falls STREAM_QUEUE_MAX events behind is dropped (its EventSource reconnects)."""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.stats = EquityStats()
+        self.recent = deque(maxlen=STREAM_REPLAY)
+        self.last_id = None
+        self.task = None
+        self.ready = asyncio.Event()  # replay buffer seeded
+        self.polls = 0
+        self.dropped = 0
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=STREAM_REPLAY + STREAM_QUEUE_MAX)
+        for msg in self.recent:
+            queue.put_nowait(msg)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, msg):
+        self.recent.append(msg)
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(msg)
+            except asyncio.QueueFull:
+                # slow client: drop it rather than buffer without bound or stall everyone else
+                self.subscribers.discard(queue)
+                self.dropped += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def poll(self):
+        if self.last_id is None:
+            rows = await asyncio.to_thread(
+                q, "SELECT id,ts_utc,timestamp_et,equity_total_usd,stale_data FROM equity_snapshots ORDER BY id DESC LIMIT ?", (STREAM_REPLAY,)
+            )
+            rows.reverse()
+            # stats see the whole 24h window (and session) up to the replay, not just the replay rows;
+            # last_id is only set once this seed succeeded, so a failed one is retried next poll
+            seed = await asyncio.to_thread(
+                q,
+                "SELECT ts_utc,equity_total_usd,stale_data FROM equity_snapshots WHERE ts_utc>=? AND id<? ORDER BY id",
+                (min(self.stats.session_start, int(time.time()) - STATS_WINDOW_SEC), rows[0]["id"] if rows else 0),
+            )
+            for r in seed:
+                self.stats.update(r["ts_utc"], r["equity_total_usd"], r["stale_data"])
+            self.last_id = rows[-1]["id"] if rows else 0
+        else:
+            rows = await asyncio.to_thread(
+                q, "SELECT id,ts_utc,timestamp_et,equity_total_usd,stale_data FROM equity_snapshots WHERE id>? ORDER BY id", (self.last_id,)
+            )
+        self.polls += 1
+        for r in rows:
+            self.last_id = r["id"]
+            self.stats.update(r["ts_utc"], r["equity_total_usd"], r["stale_data"])
+            self.publish(f"data: {json.dumps({**r, 'stats': self.stats.summary()})}\n\n")
+        self.ready.set()
+
+    async def run(self):
         while True:
-            rows = q("SELECT id,ts_utc,timestamp_et,equity_total_usd,stale_data FROM equity_snapshots WHERE id>? ORDER BY id", (last_id,))
-            for r in rows:
-                last_id = r["id"]
-                yield f"data: {json.dumps(r)}\n\n"
-            time.sleep(1)
+            try:
+                await self.poll()
+            except Exception as e:
+                print(f"stream poll failed: {e}")
+            await asyncio.sleep(STREAM_POLL_SEC)
+
+
+broadcaster = Broadcaster()
+
+
+@app.get("/stream")
+async def stream():
+    broadcaster.start()
+    await broadcaster.ready.wait()
+    queue = broadcaster.subscribe()
+
+    async def gen():
+        try:
+            while True:
+                msg = await queue.get()
+                if msg is None:
+                    break
+                yield msg
+        finally:
+            broadcaster.unsubscribe(queue)
+
     return StreamingResponse(gen(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+async def stats():
+    broadcaster.start()
+    await broadcaster.ready.wait()
+    return JSONResponse(broadcaster.stats.summary())
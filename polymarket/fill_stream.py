@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""User-channel WebSocket consumer: authoritative in-memory order + fill tables.
+
+Orders are stored in the same row shape as `ClobClient.get_orders()` (id, asset_id, side,
+price, original_size, size_matched, status) so REST consumers can switch over unchanged.
+Lookup by order id is a dict hit. Fills are pushed to subscribers as they arrive.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+
+import websockets
+
+WSS_USER_URL = "wss://ws-subscriptions-clob.polymarket.com/ws/user"
+OPEN_STATUS = {"LIVE", "PARTIALLY_FILLED"}
+TRADE_RETENTION_SEC = 3600  # trade dedupe entries kept this long (MATCHED -> CONFIRMED takes seconds to minutes)
+PRUNE_EVERY_SEC = 60
+
+
+def opposite(side):
+    return "SELL" if side == "BUY" else "BUY"
+
+
+class FillStream:
+    def __init__(self, creds, markets=None):
+        self.creds = creds  # ApiCreds from create_or_derive_api_creds()
+        self.markets = list(markets or [])  # condition ids; empty = every market for this key
+        self.orders = {}  # order_id -> REST-shaped order row
+        self.open_by_token = defaultdict(set)  # token_id -> open order ids
+        self.trades = {}  # trade_id -> (last status seen, first seen)
+        self.fills = {}  # (trade_id, order_id) -> fill
+        self.pruned_at = time.time()
+        self.on_fill = []
+        self.on_order = []
+        self.connected = False
+        self.version = 0  # bumped on every order/fill change
+        self.token_version = defaultdict(int)  # token_id -> bumped on every order/fill change for that token
+        self.last_event_ts = None
+        self.lock = threading.Lock()  # tables are read from other threads when run via start_thread()
+
+    def subscribe(self, on_fill=None, on_order=None):
+        if on_fill:
+            self.on_fill.append(on_fill)
+        if on_order:
+            self.on_order.append(on_order)
+
+    # ---- reads ------------------------------------------------------------
+
+    def get(self, order_id):
+        return self.orders.get(order_id)
+
+    def open_orders(self, token_id=None):
+        with self.lock:
+            ids = list(self.open_by_token.get(token_id, ())) if token_id else [i for s in self.open_by_token.values() for i in s]
+            return [dict(self.orders[i]) for i in ids if i in self.orders]
+
+    # ---- table maintenance ------------------------------------------------
+
+    def _put_order(self, row):
+        oid = row["id"]
+        tid = row["asset_id"]
+        with self.lock:
+            self.orders[oid] = row
+            if row["status"] in OPEN_STATUS:
+                self.open_by_token[tid].add(oid)
+            elif oid in self.open_by_token.get(tid, ()):
+                self.open_by_token[tid].discard(oid)
+                if not self.open_by_token[tid]:
+                    del self.open_by_token[tid]
+            self.version += 1
+            self.token_version[tid] += 1
+        for cb in self.on_order:
+            cb(row)
+
+    def seed_orders(self, client):
+        """One REST read of open orders so the table is complete before the stream takes over."""
+        orders = client.get_orders()
+        olist = orders.get("orders", orders) if isinstance(orders, dict) else (orders or [])
+        for o in olist:
+            self._put_order({
+                "id": str(o.get("id")),
+                "asset_id": str(o.get("asset_id") or ""),
+                "market": o.get("market"),
+                "side": str(o.get("side") or "").upper(),
+                "price": o.get("price"),
+                "original_size": o.get("original_size"),
+                "size_matched": o.get("size_matched"),
+                "status": str(o.get("status") or "").upper(),
+            })
+        return len(olist)
+
+    def _handle_order(self, m):
+        oid = str(m.get("id") or "")
+        if not oid:
+            return
+        prev = self.orders.get(oid, {})
+        kind = str(m.get("type") or "").upper()
+        orig = float(m.get("original_size") or prev.get("original_size") or 0)
+        matched = float(m.get("size_matched") or prev.get("size_matched") or 0)
+        if kind == "CANCELLATION":
+            status = "CANCELED"
+        elif orig > 0 and matched >= orig - 1e-9:
+            status = "MATCHED"
+        elif matched > 0:
+            status = "PARTIALLY_FILLED"
+        else:
+            status = "LIVE"
+        self._put_order({
+            "id": oid,
+            "asset_id": str(m.get("asset_id") or prev.get("asset_id") or ""),
+            "market": m.get("market") or prev.get("market"),
+            "side": str(m.get("side") or prev.get("side") or "").upper(),
+            "price": m.get("price") or prev.get("price"),
+            "original_size": str(orig),
+            "size_matched": str(matched),
+            "status": status,
+        })
+
+    def _our_fills(self, t):
+        """Split a trade message into the legs that belong to this API key."""
+        key = self.creds.api_key
+        out = []
+        for mo in t.get("maker_orders") or []:
+            if mo.get("owner") != key:
+                continue
+            oid = str(mo.get("order_id"))
+            known = self.orders.get(oid)
+            if known and known.get("side"):
+                side = known["side"]
+            elif mo.get("side"):
+                side = str(mo["side"]).upper()
+            else:
+                # same asset -> counterparty of the taker; complementary asset -> same side (mint/merge)
+                taker_side = str(t.get("side") or "").upper()
+                side = opposite(taker_side) if mo.get("asset_id") == t.get("asset_id") else taker_side
+            out.append((oid, str(mo.get("asset_id") or t.get("asset_id")), side, float(mo.get("price") or 0), float(mo.get("matched_amount") or 0)))
+        if not out and t.get("taker_order_id"):
+            out.append((str(t["taker_order_id"]), str(t.get("asset_id")), str(t.get("side") or "").upper(), float(t.get("price") or 0), float(t.get("size") or 0)))
+        return out
+
+    def _handle_trade(self, t):
+        trade_id = str(t.get("id") or "")
+        status = str(t.get("status") or "").upper()
+        if not trade_id:
+            return
+        prev = self.trades.get(trade_id)
+        self.trades[trade_id] = (status, prev[1] if prev else time.time())
+        self._prune()
+        if status == "FAILED":
+            return
+        ts = int(t.get("matchtime") or t.get("match_time") or t.get("timestamp") or time.time())
+        for oid, tid, side, px, sz in self._our_fills(t):
+            if (trade_id, oid) in self.fills or sz <= 0:
+                continue  # MATCHED -> MINED -> CONFIRMED: book each leg once
+            fill = {"trade_id": trade_id, "order_id": oid, "token_id": tid, "side": side, "price": px, "size": sz, "ts": ts}
+            with self.lock:
+                self.fills[(trade_id, oid)] = fill
+                self.version += 1
+                self.token_version[tid] += 1
+            for cb in self.on_fill:
+                cb(fill)
+
+    def _prune(self):
+        """Drop trades (and their fills) first seen more than TRADE_RETENTION_SEC ago."""
+        now = time.time()
+        if now - self.pruned_at < PRUNE_EVERY_SEC:
+            return
+        self.pruned_at = now
+        horizon = now - TRADE_RETENTION_SEC
+        old = {tid for tid, (_, first) in self.trades.items() if first < horizon}
+        if not old:
+            return
+        with self.lock:
+            for tid in old:
+                del self.trades[tid]
+            for key in [k for k in self.fills if k[0] in old]:
+                del self.fills[key]
+
+    def handle(self, msg):
+        self.last_event_ts = time.time()
+        evt = msg.get("event_type")
+        if evt == "order":
+            self._handle_order(msg)
+        elif evt == "trade":
+            self._handle_trade(msg)
+
+    # ---- transport --------------------------------------------------------
+
+    async def run(self):
+        sub = {
+            "auth": {"apiKey": self.creds.api_key, "secret": self.creds.api_secret, "passphrase": self.creds.api_passphrase},
+            "type": "USER",
+            "markets": self.markets,
+        }
+        delay = 1
+        while True:
+            try:
+                async with websockets.connect(WSS_USER_URL, ping_interval=30) as ws:
+                    await ws.send(json.dumps(sub))
+                    delay = 1
+                    async for raw in ws:
+                        try:
+                            msgs = json.loads(raw)
+                        except json.JSONDecodeError:
+                            continue
+                        for m in msgs if isinstance(msgs, list) else [msgs]:
+                            if not isinstance(m, dict) or not m.get("event_type"):
+                                continue
+                            # the first real event proves the subscription was accepted; until then
+                            # callers keep their REST fallback
+                            self.connected = True
+                            try:
+                                self.handle(m)
+                            except Exception as e:
+                                print(f"  FILL STREAM event error: {e}")
+            except Exception as e:
+                print(f"  FILL STREAM disconnected: {e} (retry in {delay}s)")
+            self.connected = False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def start_thread(self):
+        """Run the stream on its own event loop for synchronous callers (collector, reconcile)."""
+        t = threading.Thread(target=lambda: asyncio.run(self.run()), name="fill-stream", daemon=True)
+        t.start()
+        return t
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""In-process USDC/position ledger: seeded from REST once, kept current from order acks and fills.
+
+Pre-trade checks read `free_usdc()` / `free_tokens()` from memory. A background loop
+re-reads balances + open orders on a slow cadence, flags drift and re-anchors.
+All mutation happens on the event loop thread; only REST fetches run on the gateway pool.
+"""
+import asyncio
+import os
+import time
+from collections import defaultdict
+
+from py_clob_client.clob_types import AssetType, BalanceAllowanceParams
+
+RECONCILE_SEC = float(os.getenv("LEDGER_RECONCILE_SEC", "30"))
+USDC_DRIFT_TOL = float(os.getenv("LEDGER_USDC_DRIFT_TOL", "0.05"))
+SHARE_DRIFT_TOL = float(os.getenv("LEDGER_SHARE_DRIFT_TOL", "0.01"))
+DUST = 1e-6
+
+# Conservative reservation set (Selene): LIVE + PARTIALLY_FILLED
+RESERVE_STATUS = {"LIVE", "PARTIALLY_FILLED"}
+
+
+def fetch_usdc(client):
+    r = client.get_balance_allowance(BalanceAllowanceParams(asset_type=AssetType.COLLATERAL, token_id="", signature_type=0))
+    return int(r.get("balance", "0")) / 1e6
+
+
+def fetch_token(client, token_id):
+    r = client.get_balance_allowance(
+        BalanceAllowanceParams(asset_type=AssetType.CONDITIONAL, token_id=token_id, signature_type=0)
+    )
+    # conditional token balance is in 1e6 precision
+    return int(r.get("balance", "0")) / 1e6
+
+
+def open_order_rows(client):
+    """One get_orders() REST read, as a list of order rows."""
+    orders = client.get_orders()
+    return orders.get("orders", orders) if isinstance(orders, dict) else (orders or [])
+
+
+def reserved_orders(olist):
+    """Reserving orders as (token_id, side, remaining, price, order_id)."""
+    out = []
+    for o in olist:
+        if str(o.get("status") or "").upper() not in RESERVE_STATUS:
+            continue
+        try:
+            rem = max(0.0, float(o.get("original_size") or 0) - float(o.get("size_matched") or 0))
+            px = float(o.get("price") or 0)
+        except Exception:
+            continue
+        out.append((str(o.get("asset_id") or ""), str(o.get("side") or "").upper(), rem, px, str(o.get("id") or "")))
+    return out
+
+
+def fetch_open_orders(client):
+    return {
+        oid: {"token_id": token_id, "side": side, "price": px, "remaining": rem}
+        for token_id, side, rem, px, oid in reserved_orders(open_order_rows(client))
+    }
+
+
+def fetch_remote(client, token_ids):
+    """Everything the ledger tracks, straight from REST (blocking; run it on an executor)."""
+    return {
+        "usdc": fetch_usdc(client),
+        "tokens": {tid: fetch_token(client, tid) for tid in token_ids},
+        "orders": fetch_open_orders(client),
+    }
+
+
+class Ledger:
+    def __init__(self, book_ack_matches=True):
+        # False when fills arrive from the user channel (fill_stream), which would otherwise double-book them
+        self.book_ack_matches = book_ack_matches
+        self.usdc = 0.0
+        self.tokens = defaultdict(float)  # token_id -> shares held
+        self.orders = {}  # order_id -> {token_id, side, price, remaining}
+        self.reserved_usdc = 0.0
+        self.reserved_tokens = defaultdict(float)
+        self.unacked_fills = defaultdict(float)  # order_id -> shares filled before its post_order ack returned
+        self.touched = set()  # tokens changed locally since the last reconcile
+        self.version = 0  # bumped on every local change
+        self.seeded_at = None
+        self.reconciled_at = None
+        self.drift_events = 0
+
+    # ---- reads (hot path) -------------------------------------------------
+
+    def free_usdc(self):
+        return self.usdc - self.reserved_usdc
+
+    def free_tokens(self, token_id):
+        return self.tokens.get(token_id, 0.0) - self.reserved_tokens.get(token_id, 0.0)
+
+    def summary(self):
+        held = sum(1 for q in self.tokens.values() if q > DUST)
+        return f"usdc={self.usdc:.2f} free={self.free_usdc():.2f} held={held} open={len(self.orders)} drift={self.drift_events}"
+
+    # ---- state changes ----------------------------------------------------
+
+    def load(self, remote):
+        self.usdc = remote["usdc"]
+        self.tokens = defaultdict(float, {t: q for t, q in remote["tokens"].items() if q > DUST})
+        self.orders = {}
+        self.reserved_usdc = 0.0
+        self.reserved_tokens = defaultdict(float)
+        self.unacked_fills = defaultdict(float)
+        for oid, o in remote["orders"].items():
+            self._reserve(oid, o)
+
+    def seed(self, client, token_ids):
+        self.load(fetch_remote(client, token_ids))
+        self.seeded_at = time.time()
+
+    def _reserve(self, order_id, o):
+        self.orders[order_id] = o
+        if o["side"] == "BUY":
+            self.reserved_usdc += o["remaining"] * o["price"]
+        else:
+            self.reserved_tokens[o["token_id"]] += o["remaining"]
+
+    def _release(self, o, size):
+        size = min(size, o["remaining"])
+        o["remaining"] -= size
+        if o["side"] == "BUY":
+            self.reserved_usdc = max(0.0, self.reserved_usdc - size * o["price"])
+        else:
+            tid = o["token_id"]
+            self.reserved_tokens[tid] = max(0.0, self.reserved_tokens[tid] - size)
+
+    def on_ack(self, token_id, side, price, size, resp):
+        """Posted order acknowledged: reserve it, and book whatever the ack says matched immediately."""
+        if not isinstance(resp, dict) or not resp.get("success", True):
+            return
+        self.version += 1
+        order_id = str(resp.get("orderID") or f"local-{time.time_ns()}")
+        remaining = max(0.0, size - self.unacked_fills.pop(order_id, 0.0))
+        if remaining > DUST:
+            self._reserve(order_id, {"token_id": token_id, "side": side, "price": price, "remaining": remaining})
+        if self.book_ack_matches and str(resp.get("status") or "").lower() == "matched":
+            # BUY: making=USDC, taking=shares; SELL: making=shares, taking=USDC
+            try:
+                making = float(resp.get("makingAmount") or 0)
+                taking = float(resp.get("takingAmount") or 0)
+            except (TypeError, ValueError):
+                making = taking = 0.0
+            shares = taking if side == "BUY" else making
+            if shares > 0:
+                self.on_fill(order_id, token_id, side, price, min(shares, remaining))
+
+    def on_fill(self, order_id, token_id, side, price, size):
+        self.version += 1
+        o = self.orders.get(order_id)
+        if o is not None:
+            self._release(o, size)
+            if o["remaining"] <= DUST:
+                del self.orders[order_id]
+        elif not self.book_ack_matches:
+            self.unacked_fills[order_id] += size
+        if side == "BUY":
+            self.tokens[token_id] += size
+            self.usdc -= size * price
+        else:
+            self.tokens[token_id] = max(0.0, self.tokens[token_id] - size)
+            self.usdc += size * price
+        self.touched.add(token_id)
+
+    def on_order_closed(self, order_id):
+        o = self.orders.pop(order_id, None)
+        if o is not None:
+            self.version += 1
+            self._release(o, o["remaining"])
+            self.touched.add(o["token_id"])
+
+    # ---- background reconcile ---------------------------------------------
+
+    def reconcile_tokens(self):
+        tids = {t for t, q in self.tokens.items() if q > DUST} | {o["token_id"] for o in self.orders.values()}
+        return sorted(tids | self.touched)
+
+    def apply_remote(self, remote):
+        """Compare REST truth with local state, then re-anchor. Returns drift descriptions."""
+        drift = []
+        if abs(remote["usdc"] - self.usdc) > USDC_DRIFT_TOL:
+            drift.append(f"USDC local={self.usdc:.4f} rest={remote['usdc']:.4f}")
+        for tid, q in remote["tokens"].items():
+            local = self.tokens.get(tid, 0.0)
+            if abs(q - local) > SHARE_DRIFT_TOL:
+                drift.append(f"{tid[:10]} local={local:.4f} rest={q:.4f}")
+        self.load(remote)
+        self.touched.clear()
+        self.reconciled_at = time.time()
+        self.drift_events += len(drift)
+        return drift
+
+    async def reconcile_loop(self, gateway, cadence=RECONCILE_SEC):
+        while True:
+            await asyncio.sleep(cadence)
+            # an unacked order may already show up on REST: compare only when nothing is in flight
+            if gateway.inflight:
+                continue
+            version = self.version
+            try:
+                remote = await gateway.call(fetch_remote, gateway.client, self.reconcile_tokens())
+            except Exception as e:
+                print(f"  LEDGER RECONCILE FAILED: {e}")
+                continue
+            if self.version != version or gateway.inflight:
+                continue  # local state moved during the fetch; try again next round
+            for d in self.apply_remote(remote):
+                print(f"  LEDGER DRIFT: {d}")
@@ -1,23 +1,83 @@
 #!/usr/bin/env python3
+"""Sell every open position into the bid ladder.
+
+Each position is split into FAK child orders sized to the depth at each bid level (thin levels
+merged until a child reaches the market's minimum order size), from the best bid down to
+--max-slippage below it, and the children are posted together.
+Default: one position at a time. --flatten: emergency flatten-all -- all books fetched
+concurrently, all children signed in parallel and posted as FAK batches with bounded
+concurrency, then any unfilled remainder is re-swept against fresh books.
+"""
+import argparse
 import os
+import time
 import requests
 from dotenv import load_dotenv
 from py_clob_client.client import ClobClient
-from py_clob_client.clob_types import OrderArgs, OrderType
+from py_clob_client.clob_types import BookParams, OrderArgs, OrderType, PostOrdersArgs
+
+from order_gateway import filled_shares
 
 CLOB_HOST = "https://clob.polymarket.com"
 DATA_API = "https://data-api.polymarket.com"
 CHAIN_ID = 137
 
+FLATTEN_WORKERS = 8  # max concurrent book fetches / batch posts
+FLATTEN_SWEEPS = 3  # passes over whatever is left unfilled
+BOOK_CHUNK = 20  # tokens per POST /books
+MAX_SLIPPAGE = 0.05  # deepest child price, as a fraction below the best bid
+MAX_CHILDREN = 15  # bid levels per position (one POST /orders batch)
+DUST = 0.01
+MIN_ORDER_SIZE = 5.0  # shares; used when the book does not report min_order_size
+
+
+def min_size_of(value):
+    try:
+        return float(value) if value else MIN_ORDER_SIZE
+    except (TypeError, ValueError):
+        return MIN_ORDER_SIZE
 
-def best_bid(token_id: str):
+
+def bid_ladder(token_id: str):
+    """(bids best first, min order size) for one token."""
     r = requests.get(f"{CLOB_HOST}/book", params={"token_id": token_id}, timeout=20)
     r.raise_for_status()
     book = r.json()
-    bids = book.get("bids") or []
-    if not bids:
-        return None
-    return max(float(b["price"]) for b in bids if b.get("price") is not None)
+    bids = [(float(b["price"]), float(b.get("size") or 0)) for b in book.get("bids") or [] if b.get("price") is not None]
+    return sorted(bids, reverse=True), min_size_of(book.get("min_order_size"))
+
+
+def slice_sell(token_id: str, size: float, ladder, max_slippage: float = MAX_SLIPPAGE, min_size: float = MIN_ORDER_SIZE):
+    """SELL children walking the ladder (best first) down to best*(1-max_slippage); size beyond that depth is left.
+
+    Levels are merged until a child holds at least `min_size` (priced at the deepest merged level,
+    which a FAK sell also fills above); a remainder below it is folded into the last child.
+    """
+    if not ladder or size < min_size - 1e-9:
+        return []  # below the market minimum the CLOB rejects any sell
+    floor = ladder[0][0] * (1 - max_slippage) - 1e-9
+    legs = []
+    left = size
+    pending = 0.0
+    pending_px = None
+    for px, depth in ladder:
+        if px < floor or left - pending <= DUST or len(legs) >= MAX_CHILDREN:
+            break
+        pending = round(pending + min(depth, left - pending), 2)
+        pending_px = px
+        if pending >= min_size - 1e-9:
+            legs.append({"token_id": token_id, "side": "SELL", "price": round(px, 4), "size": pending})
+            left = round(left - pending, 2)
+            pending = 0.0
+    if pending > DUST:
+        if legs:
+            last = legs[-1]
+            last["size"] = round(last["size"] + pending, 2)
+            last["price"] = round(pending_px, 4)
+        else:
+            # in-range depth is thinner than one minimum order: send the minimum, FAK takes what is there
+            legs.append({"token_id": token_id, "side": "SELL", "price": round(pending_px, 4), "size": round(min(left, min_size), 2)})
+    return legs
 
 
 def get_positions(wallet: str):
@@ -38,7 +98,77 @@ def get_positions(wallet: str):
     return out
 
 
+def fetch_ladders(pool, client, token_ids):
+    """(bid ladder best first, min order size) per token, and the error per token whose /books
+    chunk failed; chunks are fetched in parallel on `pool` and a failed one doesn't abort the rest."""
+    chunks = [token_ids[i:i + BOOK_CHUNK] for i in range(0, len(token_ids), BOOK_CHUNK)]
+
+    def fetch(ids):
+        try:
+            return client.get_order_books([BookParams(token_id=t) for t in ids]), None
+        except Exception as e:
+            return [], str(e)
+
+    out, failed = {}, {}
+    for ids, (books, err) in zip(chunks, pool.map(fetch, chunks)):
+        if err:
+            failed.update((t, err) for t in ids)
+        for b in books:
+            ladder = sorted(((float(x.price), float(x.size)) for x in (getattr(b, "bids", None) or [])), reverse=True)
+            out[str(b.asset_id)] = (ladder, min_size_of(getattr(b, "min_order_size", None)))
+    return out, failed
+
+
+def flatten_all(client, positions, workers=FLATTEN_WORKERS, sweeps=FLATTEN_SWEEPS, max_slippage=MAX_SLIPPAGE):
+    """Sell everything as fast as the API allows. Returns (per-position rows, seconds to flat)."""
+    from multileg import MultiLegExecutor
+
+    t0 = time.perf_counter()
+    ex = MultiLegExecutor(client, workers=workers)
+    rows = {p["token_id"]: {**p, "size": round(float(p["size"]), 2), "filled": 0.0, "orders": 0, "errors": []} for p in positions}
+    try:
+        for sweep in range(sweeps):
+            todo = [r for r in rows.values() if r["size"] - r["filled"] > DUST]
+            if not todo:
+                break
+            # errors are isolated per /books chunk and per leg: a failing token is recorded on
+            # its row and retried next sweep while the others keep selling
+            ladders, failed = fetch_ladders(ex.pool, client, [r["token_id"] for r in todo])
+            for tid, err in failed.items():
+                rows[tid]["errors"].append(f"book: {err}")
+            legs = []
+            for r in todo:
+                ladder, min_size = ladders.get(r["token_id"], ([], MIN_ORDER_SIZE))
+                legs += slice_sell(r["token_id"], round(r["size"] - r["filled"], 2), ladder, max_slippage, min_size)
+            if not legs and not failed:
+                break
+            signed, sign_ms = ex.sign_each(legs)
+            for leg, (_, err) in zip(legs, signed):
+                if err:
+                    rows[leg["token_id"]]["errors"].append(f"{leg['size']:.2f}@{leg['price']:.4f}: sign: {err}")
+            ok = [(leg, order) for leg, (order, err) in zip(legs, signed) if not err]
+            posted = ex.post_all([order for _, order in ok], OrderType.FAK) if ok else []
+            for (leg, _), (resp, _, _) in zip(ok, posted):
+                r = rows[leg["token_id"]]
+                r["orders"] += 1
+                r["filled"] += filled_shares("SELL", resp)
+                if (resp or {}).get("errorMsg"):
+                    r["errors"].append(f"{leg['size']:.2f}@{leg['price']:.4f}: {resp['errorMsg']}")
+            left = sum(1 for r in rows.values() if r["size"] - r["filled"] > DUST)
+            print(f"sweep {sweep + 1}: books={len(ladders)} orders={len(ok)} sign={sign_ms:.0f}ms open={left} t={time.perf_counter() - t0:.2f}s")
+    finally:
+        ex.shutdown()
+    return list(rows.values()), time.perf_counter() - t0
+
+
 def main():
+    ap = argparse.ArgumentParser(description="Sell all open positions into the bid ladder")
+    ap.add_argument("--flatten", action="store_true", help="emergency mode: concurrent books, parallel signing, batched FAK + re-sweep")
+    ap.add_argument("--workers", type=int, default=FLATTEN_WORKERS)
+    ap.add_argument("--sweeps", type=int, default=FLATTEN_SWEEPS)
+    ap.add_argument("--max-slippage", type=float, default=MAX_SLIPPAGE, help="lowest child price as a fraction below the best bid")
+    args = ap.parse_args()
+
     load_dotenv("/home/codespace/.openclaw/workspace/polymarket/.env")
     pk = os.getenv("POLYGON_WALLET_PRIVATE_KEY")
     if not pk:
@@ -56,6 +186,16 @@ def main():
     print(f"Wallet: {wallet}")
     print(f"Open positions: {len(positions)}")
 
+    if args.flatten:
+        rows, secs = flatten_all(client, positions, workers=args.workers, sweeps=args.sweeps, max_slippage=args.max_slippage)
+        for r in rows:
+            residual = max(0.0, r["size"] - r["filled"])
+            print(f"{'FLAT' if residual <= DUST else 'LEFT'} filled={r['filled']:.2f} residual={residual:.2f} orders={r['orders']} | {r['title'][:80]}"
+                  + (f" | errors={'; '.join(r['errors'])}" if r["errors"] else ""))
+        flat = sum(1 for r in rows if r["size"] - r["filled"] <= DUST)
+        print(f"Done. positions={len(rows)} flat={flat} time_to_flat={secs:.2f}s")
+        return
+
     sold = 0
     skipped = 0
     for p in positions:
@@ -67,20 +207,25 @@ def main():
             skipped += 1
             continue
 
-        bid = best_bid(token_id)
-        if not bid or bid <= 0:
-            print(f"SKIP no bid | size={size} | {title}")
+        ladder, min_size = bid_ladder(token_id)
+        legs = slice_sell(token_id, size, ladder, args.max_slippage, min_size)
+        if not legs:
+            reason = f"below min_order_size={min_size:g}" if ladder and size < min_size - 1e-9 else "no bid"
+            print(f"SKIP {reason} | size={size} | {title}")
             skipped += 1
             continue
 
         try:
-            order_args = OrderArgs(price=round(bid, 4), size=size, side="SELL", token_id=token_id)
-            signed = client.create_order(order_args)
-            resp = client.post_order(signed, OrderType.FAK)
-            print(f"SELL size={size} @ {bid:.4f} | {title} | resp={resp}")
+            signed = [client.create_order(OrderArgs(price=leg["price"], size=leg["size"], side="SELL", token_id=token_id)) for leg in legs]
+            resps = client.post_orders([PostOrdersArgs(order=o, orderType=OrderType.FAK) for o in signed])
+            if not isinstance(resps, list):
+                resps = [resps] * len(legs)
+            filled = sum(filled_shares("SELL", r) for r in resps)
+            levels = ", ".join(f"{leg['size']:.2f}@{leg['price']:.4f}" for leg in legs)
+            print(f"SELL filled={filled:.2f} residual={max(0.0, size - filled):.2f} | {levels} | {title}")
             sold += 1
         except Exception as e:
-            print(f"FAIL size={size} @ {bid:.4f} | {title} | err={e}")
+            print(f"FAIL size={size} children={len(legs)} | {title} | err={e}")
 
     print(f"Done. attempted={len(positions)} sold_calls={sold} skipped={skipped}")
 
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Market-channel marks: per-token best bid/ask and last trade price, kept current from the
+`book`, `price_change` and `last_trade_price` events of the tokens we hold.
+
+`mark()` is a dict read. `changed` is set on every mark move so a consumer can block on it
+instead of polling; `version` lets it tell whether anything moved since it last looked.
+A side of the book that empties is cleared, so `mark()` returns None and the caller falls
+back to REST rather than valuing at a bid/ask that no longer exists.
+"""
+import threading
+
+from market_channel import MarketChannel
+
+MARK_SOURCES = ("mid", "last")
+
+
+class MarkStream(MarketChannel):
+    label = "MARK STREAM"
+    thread_name = "mark-stream"
+    custom_features = True
+
+    def __init__(self, source="mid"):
+        super().__init__()
+        if source not in MARK_SOURCES:
+            raise ValueError(f"mark source must be one of {MARK_SOURCES}")
+        self.source = source
+        self.bid = {}
+        self.ask = {}
+        self.last = {}
+        self.version = 0
+        self.changed = threading.Event()
+
+    def mark(self, token_id):
+        """Current mark, or None if the stream has nothing usable for this token."""
+        if not self.connected:
+            return None
+        if self.source == "mid":
+            b, a = self.bid.get(token_id), self.ask.get(token_id)
+            return (b + a) / 2 if b and a else None
+        return self.last.get(token_id)
+
+    def _set(self, table, token_id, value):
+        if value and value > 0:
+            if table.get(token_id) == value:
+                return
+            table[token_id] = value
+        elif table.pop(token_id, None) is None:
+            return  # side was already empty
+        self.version += 1
+        self.changed.set()
+
+    def handle(self, m):
+        evt = m.get("event_type")
+        aid = str(m.get("asset_id") or "")
+        if evt == "book" and aid:
+            bids = [float(x["price"]) for x in m.get("bids") or []]
+            asks = [float(x["price"]) for x in m.get("asks") or []]
+            self._set(self.bid, aid, max(bids) if bids else None)
+            self._set(self.ask, aid, min(asks) if asks else None)
+        elif evt == "price_change":
+            for pc in m.get("price_changes") or []:
+                pid = str(pc.get("asset_id") or "")
+                if not pid:
+                    continue
+                if "best_bid" in pc:
+                    self._set(self.bid, pid, float(pc["best_bid"] or 0))
+                if "best_ask" in pc:
+                    self._set(self.ask, pid, float(pc["best_ask"] or 0))
+        elif evt == "last_trade_price" and aid:
+            px = float(m.get("price") or 0)
+            if px > 0:
+                self._set(self.last, aid, px)
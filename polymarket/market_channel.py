@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Market-channel WebSocket consumer shared by the per-token caches (marks, trade watermarks).
+
+Subclasses implement `handle(msg)` and may override `on_connect(token_ids)`. The connection
+subscribes to `token_ids`, resubscribes when `subscribe()` changes the set, and reconnects
+with exponential backoff; `connected` is only true while a subscription is live.
+"""
+import asyncio
+import json
+import threading
+
+import websockets
+
+WSS_MARKET_URL = "wss://ws-subscriptions-clob.polymarket.com/ws/market"
+
+
+class MarketChannel:
+    label = "MARKET STREAM"  # log prefix
+    thread_name = "market-channel"
+    custom_features = False  # best_bid/best_ask on price_change etc.
+
+    def __init__(self):
+        self.token_ids = []
+        self.connected = False
+
+    def handle(self, msg):
+        raise NotImplementedError
+
+    def on_connect(self, token_ids):
+        """Called once per (re)subscription, before any message of it is handled."""
+
+    def subscribe(self, token_ids):
+        """Set the tokens to stream; the connection resubscribes if the set changed."""
+        self.token_ids = sorted(set(token_ids))
+
+    async def run(self):
+        delay = 1
+        while True:
+            subscribed = list(self.token_ids)
+            if not subscribed:
+                await asyncio.sleep(1)
+                continue
+            sub = {"assets_ids": subscribed, "type": "MARKET"}
+            if self.custom_features:
+                sub["custom_feature_enabled"] = True
+            try:
+                async with websockets.connect(WSS_MARKET_URL, ping_interval=30) as ws:
+                    await ws.send(json.dumps(sub))
+                    self.on_connect(subscribed)
+                    self.connected = True
+                    delay = 1
+                    while self.token_ids == subscribed:
+                        try:
+                            raw = await asyncio.wait_for(ws.recv(), timeout=5)
+                        except asyncio.TimeoutError:
+                            continue
+                        try:
+                            msgs = json.loads(raw)
+                        except json.JSONDecodeError:
+                            continue
+                        for m in msgs if isinstance(msgs, list) else [msgs]:
+                            if isinstance(m, dict):
+                                try:
+                                    self.handle(m)
+                                except (TypeError, ValueError, KeyError):
+                                    continue
+            except Exception as e:
+                print(f"  {self.label} disconnected: {e} (retry in {delay}s)")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                self.connected = False
+
+    def start_thread(self):
+        t = threading.Thread(target=lambda: asyncio.run(self.run()), name=self.thread_name, daemon=True)
+        t.start()
+        return t
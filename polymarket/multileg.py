@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Multi-leg executor for set arbitrage (event all-YES sets, binary YES+NO).
+
+All legs are signed concurrently, then posted together through the batch /orders endpoint
+(chunks of BATCH_LIMIT sent in parallel) so leg-to-leg skew is the spread of one round trip,
+not N sequential ones. Legs go out FAK by default, so each ack carries the fill. Any excess
+over the smallest filled leg is unwound at the best bid. Dry-run unless --live is passed.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from eth_account import Account
+from py_clob_client.client import ClobClient
+from py_clob_client.clob_types import BookParams, OrderType, PostOrdersArgs
+
+from liquidate_all import min_size_of
+from order_factory import OrderFactory
+from order_gateway import filled_shares
+
+load_dotenv('/opt/polybot/.env')
+PK = os.getenv('POLYGON_WALLET_PRIVATE_KEY')
+HOST = 'https://clob.polymarket.com'
+CHAIN = 137
+
+BATCH_LIMIT = 15  # max orders per POST /orders
+UNWIND_SLIPPAGE = 0.02  # fallback unwind price below entry when the book has no bid
+DUST = 0.01
+
+
+def get_client():
+    wallet = Account.from_key(PK).address
+    c = ClobClient(HOST, key=PK, chain_id=CHAIN, signature_type=0, funder=wallet)
+    c.set_api_creds(c.create_or_derive_api_creds())
+    return c, wallet
+
+
+def best_levels(book):
+    bids = [(float(b.price), float(b.size)) for b in (getattr(book, 'bids', None) or [])]
+    asks = [(float(a.price), float(a.size)) for a in (getattr(book, 'asks', None) or [])]
+    return (max(bids) if bids else None), (min(asks) if asks else None)
+
+
+def set_arb_legs(client, token_ids, shares, max_total=1.0):
+    """BUY legs at the current best ask of every token, or (None, total) if the set is not under max_total
+    or the common leg size is below any leg's minimum order size (nothing is signed or posted then)."""
+    books = client.get_order_books([BookParams(token_id=str(t)) for t in token_ids])
+    by_token = {str(b.asset_id): b for b in books}
+    legs = []
+    total = 0.0
+    min_size = 0.0
+    for tid in token_ids:
+        book = by_token.get(str(tid))
+        _, ask = best_levels(book)
+        if ask is None:
+            return None, None
+        min_size = max(min_size, min_size_of(getattr(book, 'min_order_size', None)))
+        px, depth = ask
+        total += px
+        legs.append({'token_id': str(tid), 'side': 'BUY', 'price': px, 'size': min(shares, depth)})
+    if total >= max_total:
+        return None, total
+    # every leg must be the same size or the set is not complete
+    size = round(min(leg['size'] for leg in legs), 2)
+    if size < min_size - 1e-9:
+        # the CLOB would reject some legs and leave the rest for unwind
+        return None, total
+    for leg in legs:
+        leg['size'] = size
+    return legs, total
+
+
+class MultiLegExecutor:
+    def __init__(self, client, factory=None, workers=8):
+        self.client = client
+        self.factory = factory or OrderFactory(client)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='multileg')
+
+    def sign_legs(self, legs):
+        t0 = time.perf_counter()
+        # templates first (cached after the first call per token), then all signatures in parallel
+        list(self.pool.map(lambda leg: self.factory.prepare(leg['token_id']), legs))
+        signed = list(self.pool.map(lambda leg: self.factory.sign(leg['token_id'], leg['side'], leg['price'], leg['size']), legs))
+        return signed, (time.perf_counter() - t0) * 1000
+
+    def sign_each(self, legs):
+        """Like sign_legs, but a leg that fails to sign doesn't abort the rest: returns
+        (signed order or None, error or None) per leg, and the elapsed ms."""
+        t0 = time.perf_counter()
+
+        def sign(leg):
+            try:
+                self.factory.prepare(leg['token_id'])
+                return self.factory.sign(leg['token_id'], leg['side'], leg['price'], leg['size']), None
+            except Exception as e:
+                return None, str(e)
+
+        return list(self.pool.map(sign, legs)), (time.perf_counter() - t0) * 1000
+
+    def post_all(self, signed, order_type):
+        """One POST /orders per BATCH_LIMIT chunk, chunks in parallel. Returns (responses, sent_ts, ack_ts) per leg."""
+        chunks = [list(range(i, min(i + BATCH_LIMIT, len(signed)))) for i in range(0, len(signed), BATCH_LIMIT)]
+
+        def send(idx):
+            sent = time.perf_counter()
+            try:
+                resp = self.client.post_orders([PostOrdersArgs(order=signed[i], orderType=order_type) for i in idx])
+            except Exception as e:
+                resp = [{'success': False, 'errorMsg': str(e)}] * len(idx)
+            ack = time.perf_counter()
+            if not isinstance(resp, list):
+                resp = [resp] * len(idx)
+            resp = list(resp) + [{'success': False, 'errorMsg': 'no response for order'}] * (len(idx) - len(resp))
+            return [(i, r, sent, ack) for i, r in zip(idx, resp)]
+
+        out = [None] * len(signed)
+        for part in self.pool.map(send, chunks):
+            for i, r, sent, ack in part:
+                out[i] = (r, sent, ack)
+        return out
+
+    def execute(self, legs, order_type=OrderType.FAK, unwind=True):
+        t0 = time.perf_counter()
+        signed, sign_ms = self.sign_legs(legs)
+        posted = self.post_all(signed, order_type)
+        sent = [p[1] for p in posted]
+        acks = [p[2] for p in posted]
+
+        report_legs = []
+        for leg, (resp, _, _) in zip(legs, posted):
+            f = filled_shares(leg['side'], resp)
+            report_legs.append({**leg, 'filled': f, 'order_id': (resp or {}).get('orderID'), 'error': (resp or {}).get('errorMsg') or None})
+
+        complete = min(r['filled'] for r in report_legs) if report_legs else 0.0
+        unwinds = self.unwind(report_legs, complete) if unwind else []
+        return {
+            'legs': report_legs,
+            'complete_sets': complete,
+            'sign_ms': round(sign_ms, 2),
+            'leg_send_skew_ms': round((max(sent) - min(sent)) * 1000, 2) if sent else 0.0,
+            'leg_ack_skew_ms': round((max(acks) - min(acks)) * 1000, 2) if acks else 0.0,
+            'total_ms': round((time.perf_counter() - t0) * 1000, 2),
+            'unwinds': unwinds,
+        }
+
+    def unwind(self, report_legs, complete):
+        """Sell back whatever one leg filled beyond the complete sets, in one batch at the best bid."""
+        excess = [(r, round(r['filled'] - complete, 2)) for r in report_legs if r['filled'] - complete > DUST]
+        if not excess:
+            return []
+        books = self.client.get_order_books([BookParams(token_id=r['token_id']) for r, _ in excess])
+        by_token = {str(b.asset_id): b for b in books}
+        legs = []
+        for r, qty in excess:
+            bid, _ = best_levels(by_token.get(r['token_id']))
+            px = bid[0] if bid else max(0.01, round(r['price'] - UNWIND_SLIPPAGE, 2))
+            legs.append({'token_id': r['token_id'], 'side': 'SELL', 'price': px, 'size': qty})
+        signed, _ = self.sign_legs(legs)
+        posted = self.post_all(signed, OrderType.FAK)
+        out = []
+        for leg, (resp, _, _) in zip(legs, posted):
+            sold = filled_shares('SELL', resp)
+            out.append({**leg, 'sold': sold, 'residual': round(leg['size'] - sold, 2)})
+        return out
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+        self.factory.shutdown()
+
+
+def print_report(title, rep):
+    print(f"\n{title}")
+    print(f"  complete_sets={rep['complete_sets']:.2f} sign={rep['sign_ms']}ms send_skew={rep['leg_send_skew_ms']}ms "
+          f"ack_skew={rep['leg_ack_skew_ms']}ms total={rep['total_ms']}ms")
+    for r in rep['legs']:
+        print(f"  BUY {r['size']:.2f} @ {r['price']:.4f} filled={r['filled']:.2f} {r['token_id'][:10]} {r['error'] or ''}")
+    for u in rep['unwinds']:
+        print(f"  UNWIND SELL {u['size']:.2f} @ {u['price']:.4f} sold={u['sold']:.2f} residual={u['residual']:.2f} {u['token_id'][:10]}")
+
+
+def main():
+    import scanner
+
+    ap = argparse.ArgumentParser(description='Execute scanner set-arbs as batched multi-leg orders')
+    ap.add_argument('--shares', type=float, default=5.0, help='sets to buy per opportunity')
+    ap.add_argument('--max-total', type=float, default=0.99, help='only trade if sum of best asks is below this')
+    ap.add_argument('--top', type=int, default=3)
+    ap.add_argument('--live', action='store_true', help='actually post orders (default: dry-run)')
+    args = ap.parse_args()
+
+    c, wallet = get_client()
+    print(f"Wallet: {wallet} | mode={'LIVE' if args.live else 'DRY-RUN'}")
+
+    candidates = []
+    for o in scanner.scan_binary_arbitrage(scanner.get_all_active_markets(max_markets=500)):
+        if o['type'] == 'binary_underpriced':
+            candidates.append((o['market'], [o['yes_token'], o['no_token']]))
+    for o in scanner.scan_event_arbitrage(scanner.get_events(limit=50)):
+        tokens = [d['token'] for d in o.get('details', [])]
+        if o['type'] == 'event_underpriced' and all(tokens):
+            candidates.append((o['event'], tokens))
+
+    ex = MultiLegExecutor(c)
+    done = 0
+    for title, tokens in candidates:
+        if done >= args.top:
+            break
+        legs, total = set_arb_legs(c, tokens, args.shares, max_total=args.max_total)
+        if not legs:
+            continue
+        done += 1
+        print(f"\n{title[:80]} | legs={len(legs)} sum_asks={total:.4f} edge/set={1 - total:.4f}")
+        if not args.live:
+            for leg in legs:
+                print(f"  (dry) BUY {leg['size']:.2f} @ {leg['price']:.4f} {leg['token_id'][:10]}")
+            continue
+        print_report(title[:80], ex.execute(legs))
+    ex.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Order factory: per-token signing templates, a dedicated signing worker and pre-signed exit ladders.
+
+`ClobClient.create_order` resolves tick size, neg-risk and fee rate (one HTTP round trip
+each on a cold cache) before it hashes and signs. The factory resolves those once per
+token up front and then signs straight through `client.builder`, so the only work left
+after a signal is the EIP-712 hash + ECDSA signature.
+"""
+import asyncio
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from py_clob_client.clob_types import CreateOrderOptions, OrderArgs
+
+EXIT_LADDER_RUNGS = 5
+EXIT_MAX_SLIP_TICKS = 3
+
+
+class OrderFactory:
+    def __init__(self, client):
+        self.client = client
+        # one worker: signing is CPU-bound and must never queue behind HTTP on the gateway pool
+        self.signer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="order-sign")
+        self.templates = {}  # token_id -> {tick, options, fee_rate_bps}
+        self.ladders = {}  # token_id -> {"size": float, "rungs": [(price, signed), ...] ascending}
+
+    def prepare(self, token_id):
+        """Resolve everything about an order that does not depend on price/size."""
+        tpl = self.templates.get(token_id)
+        if tpl:
+            return tpl
+        tick_size = self.client.get_tick_size(token_id)
+        tpl = {
+            "tick": float(tick_size),
+            "options": CreateOrderOptions(tick_size=tick_size, neg_risk=bool(self.client.get_neg_risk(token_id))),
+            "fee_rate_bps": int(self.client.get_fee_rate_bps(token_id) or 0),
+        }
+        self.templates[token_id] = tpl
+        return tpl
+
+    def sign(self, token_id, side, price, size):
+        tpl = self.prepare(token_id)
+        tick = tpl["tick"]
+        if not (tick <= price <= 1 - tick):
+            raise ValueError(f"price {price} outside [{tick}, {1 - tick}]")
+        args = OrderArgs(price=price, size=size, side=side, token_id=token_id, fee_rate_bps=tpl["fee_rate_bps"])
+        return self.client.builder.create_order(args, tpl["options"])
+
+    async def sign_async(self, token_id, side, price, size):
+        return await asyncio.get_running_loop().run_in_executor(self.signer, self.sign, token_id, side, price, size)
+
+    # ---- pre-signed exits -------------------------------------------------
+
+    def exit_ladder_prices(self, token_id, entry, profit_target, stop_loss, rungs=EXIT_LADDER_RUNGS):
+        tick = self.prepare(token_id)["tick"]
+        tp = math.ceil(entry * (1 + profit_target) / tick - 1e-9) * tick
+        sl = math.floor(entry * (1 - stop_loss) / tick + 1e-9) * tick
+        prices = [tp + i * tick for i in range(rungs)] + [sl - i * tick for i in range(rungs)]
+        return sorted({round(p, 4) for p in prices if tick <= p <= 1 - tick})
+
+    def presign_exits(self, token_id, size, entry, profit_target, stop_loss):
+        """Sign SELL orders for the TP and SL rungs of an open position (runs on the signing worker)."""
+        prices = self.exit_ladder_prices(token_id, entry, profit_target, stop_loss)
+        rungs = [(p, self.sign(token_id, "SELL", p, size)) for p in prices]
+        self.ladders[token_id] = {"size": size, "rungs": rungs, "ts": time.time()}
+        return len(rungs)
+
+    async def presign_exits_async(self, token_id, size, entry, profit_target, stop_loss):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.signer, self.presign_exits, token_id, size, entry, profit_target, stop_loss
+        )
+
+    def take_exit(self, token_id, price, size):
+        """Pop the best pre-signed SELL for a marketable exit at `price`, or None.
+
+        A SELL limit at or below the bid fills at the bid, so the highest rung <= price is used,
+        as long as it is within EXIT_MAX_SLIP_TICKS of the target. The ladder is single-use.
+        """
+        ladder = self.ladders.get(token_id)
+        if not ladder or abs(ladder["size"] - size) > 1e-9:
+            return None
+        tick = self.templates[token_id]["tick"]
+        best = None
+        for p, signed in ladder["rungs"]:
+            if p <= price + 1e-9:
+                best = (p, signed)
+        if best is None or price - best[0] > EXIT_MAX_SLIP_TICKS * tick + 1e-9:
+            return None
+        del self.ladders[token_id]
+        return best[1]
+
+    def drop_exits(self, token_id):
+        self.ladders.pop(token_id, None)
+
+    def shutdown(self):
+        self.signer.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Async order gateway: CLOB signing + HTTP off the event loop, one in-flight order per token."""
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from py_clob_client.clob_types import OrderArgs, OrderType
+
+LATENCY_WINDOW = 500
+
+
+def pct(values, q):
+    if not values:
+        return None
+    s = sorted(values)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+def filled_shares(side, resp):
+    """Shares matched immediately according to a post_order ack (0 if resting/rejected)."""
+    if not isinstance(resp, dict) or not resp.get("success"):
+        return 0.0
+    if str(resp.get("status") or "").lower() != "matched":
+        return 0.0
+    # BUY: taking=shares; SELL: making=shares
+    amount = resp.get("takingAmount") if side == "BUY" else resp.get("makingAmount")
+    try:
+        return float(amount or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class OrderGateway:
+    def __init__(self, client, max_workers=4, factory=None):
+        self.client = client
+        self.factory = factory  # OrderFactory: templates + dedicated signing worker + pre-signed exits
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="order-gw")
+        self.inflight = {}  # token_id -> asyncio.Task
+        self.ack_ms = deque(maxlen=LATENCY_WINDOW)  # submit -> ack (sign + post)
+        self.sign_ms = deque(maxlen=LATENCY_WINDOW)  # submit -> signed order ready for the wire
+        self.presigned_used = 0
+        self.submitted = 0
+        self.acked = 0
+        self.failed = 0
+        self.dupes_dropped = 0
+
+    def busy(self, token_id):
+        return token_id in self.inflight
+
+    def spawn(self, token_id, coro):
+        """Run `coro` as a task owning `token_id`; drop it if that token already has one in flight."""
+        if token_id in self.inflight:
+            self.dupes_dropped += 1
+            coro.close()
+            return False
+        task = asyncio.get_running_loop().create_task(coro)
+        self.inflight[token_id] = task
+        task.add_done_callback(lambda t: self._done(token_id, t))
+        return True
+
+    def _done(self, token_id, task):
+        if self.inflight.get(token_id) is task:
+            del self.inflight[token_id]
+        if not task.cancelled() and task.exception():
+            print(f"  ORDER TASK FAILED ({token_id[:8]}...): {task.exception()}")
+
+    async def call(self, fn, *args):
+        """Run any blocking client call on the gateway pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _sign_and_post(self, token_id, side, price, size, order_type):
+        signed = self.client.create_order(OrderArgs(price=price, size=size, side=side, token_id=token_id))
+        return self.client.post_order(signed, order_type)
+
+    async def place(self, token_id, side, price, size, order_type=OrderType.GTC):
+        t0 = time.perf_counter()
+        self.submitted += 1
+        try:
+            if self.factory is None:
+                resp = await self.call(self._sign_and_post, token_id, side, price, size, order_type)
+            else:
+                signed = self.factory.take_exit(token_id, price, size) if side == "SELL" else None
+                if signed is not None:
+                    self.presigned_used += 1
+                else:
+                    signed = await self.factory.sign_async(token_id, side, price, size)
+                self.sign_ms.append((time.perf_counter() - t0) * 1000)
+                resp = await self.call(self.client.post_order, signed, order_type)
+        except Exception:
+            self.failed += 1
+            raise
+        self.ack_ms.append((time.perf_counter() - t0) * 1000)
+        self.acked += 1
+        return resp
+
+    def stats(self):
+        lat = list(self.ack_ms)
+        sign = list(self.sign_ms)
+        return {
+            "submitted": self.submitted,
+            "acked": self.acked,
+            "failed": self.failed,
+            "dupes_dropped": self.dupes_dropped,
+            "inflight": len(self.inflight),
+            "ack_ms_p50": pct(lat, 0.50),
+            "ack_ms_p95": pct(lat, 0.95),
+            "ack_ms_max": max(lat) if lat else None,
+            "sign_ms_p50": pct(sign, 0.50),
+            "presigned_used": self.presigned_used,
+        }
+
+    def stats_line(self):
+        s = self.stats()
+        if s["ack_ms_p50"] is None:
+            return f"orders={s['submitted']} inflight={s['inflight']}"
+        return (
+            f"orders={s['submitted']} ok={s['acked']} fail={s['failed']} dup={s['dupes_dropped']} "
+            f"ack p50={s['ack_ms_p50']:.0f}ms p95={s['ack_ms_p95']:.0f}ms"
+            + (f" sign p50={s['sign_ms_p50']:.1f}ms presigned={s['presigned_used']}" if s["sign_ms_p50"] is not None else "")
+        )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.factory is not None:
+            self.factory.shutdown()
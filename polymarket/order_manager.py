@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""Order manager: explicit order lifecycle + deterministic cancel/replace for resting quotes.
+
+Single source of truth for our orders, indexed by order id and by token:
+
+    PENDING -> LIVE -> PARTIALLY_FILLED -> FILLED
+       |         |            |
+       +-> REJECTED          +-----------> CANCELLED
+
+Acks, user-channel order/fill events and cancel responses all go through `_transition`;
+anything the table does not allow is ignored. Replace is cancel-confirmed-then-post, so a
+quote that filled while we were cancelling is never doubled.
+"""
+import asyncio
+import time
+from collections import defaultdict
+
+from order_gateway import filled_shares
+from risk import RISK_LIMIT_EXCEEDED
+
+PENDING = "PENDING"
+LIVE = "LIVE"
+PARTIALLY_FILLED = "PARTIALLY_FILLED"
+FILLED = "FILLED"
+CANCELLED = "CANCELLED"
+REJECTED = "REJECTED"
+
+TRANSITIONS = {
+    PENDING: {LIVE, PARTIALLY_FILLED, FILLED, CANCELLED, REJECTED},
+    LIVE: {PARTIALLY_FILLED, FILLED, CANCELLED},
+    PARTIALLY_FILLED: {PARTIALLY_FILLED, FILLED, CANCELLED},
+    FILLED: set(),
+    CANCELLED: set(),
+    REJECTED: set(),
+}
+ACTIVE = {PENDING, LIVE, PARTIALLY_FILLED}
+
+QUOTE_TTL_SEC = 120  # resting quotes older than this are pulled
+EARLY_FILL_TTL_SEC = 60  # early fills whose order was never acked to us are dropped after this
+MAX_CHASE = 0.02  # never move a quote further than this from where it started
+
+
+class OrderManager:
+    def __init__(self, gateway, tick=0.01, risk=None):
+        self.gateway = gateway
+        self.tick = tick  # fallback when a token's own tick size can't be read
+        self.ticks = {}  # token_id -> tick size
+        self.risk = risk  # optional RiskEngine: replacement posts pass the same gate as new entries
+        self.orders = {}  # order_id -> record
+        self.by_token = defaultdict(set)  # token_id -> active order ids
+        self.listeners = []  # cb(record, old_state, new_state)
+        self.ack_listeners = []  # cb(token_id, side, price, size, resp) for every post, replacements included
+        self.early_fills = {}  # order_id -> (shares filled before the ack rekeyed it, first seen)
+        self.ack_credit = {}  # order_id -> shares the ack matched that the user channel has not reported yet
+        self.replaced = 0
+        self.cancelled = 0
+
+    def subscribe(self, on_change=None, on_ack=None):
+        if on_change:
+            self.listeners.append(on_change)
+        if on_ack:
+            self.ack_listeners.append(on_ack)
+
+    # ---- reads ------------------------------------------------------------
+
+    def active(self, token_id=None):
+        ids = self.by_token.get(token_id, ()) if token_id else [i for s in self.by_token.values() for i in s]
+        return [self.orders[i] for i in ids]
+
+    def quotes(self, token_id):
+        return [o for o in self.active(token_id) if o["tag"] == "quote"]
+
+    def summary(self):
+        n = sum(len(s) for s in self.by_token.values())
+        return f"open={n} replaced={self.replaced} cancelled={self.cancelled}"
+
+    async def tick_size(self, token_id):
+        """Tick of `token_id`'s book, read once per token (from the order factory's template when
+        there is one); the default tick if it can't be read, retried on the next order."""
+        tick = self.ticks.get(token_id)
+        if tick is None:
+            factory = getattr(self.gateway, "factory", None)
+            try:
+                if factory is not None:
+                    tick = (await self.gateway.call(factory.prepare, token_id))["tick"]
+                else:
+                    tick = float(await self.gateway.call(self.gateway.client.get_tick_size, token_id))
+            except Exception:
+                return self.tick
+            self.ticks[token_id] = tick
+        return tick
+
+    # ---- state machine ----------------------------------------------------
+
+    def _transition(self, o, new):
+        old = o["state"]
+        if new not in TRANSITIONS[old]:
+            return False
+        o["state"] = new
+        o["updated"] = time.time()
+        if new not in ACTIVE:
+            ids = self.by_token.get(o["token_id"])
+            if ids is not None:
+                ids.discard(o["id"])
+                if not ids:
+                    del self.by_token[o["token_id"]]
+        for cb in self.listeners:
+            cb(o, old, new)
+        return True
+
+    def _apply_fill(self, o, size):
+        o["filled"] = min(o["size"], o["filled"] + size)
+        self._transition(o, FILLED if o["size"] - o["filled"] <= 1e-6 else PARTIALLY_FILLED)
+
+    def _rekey(self, o, order_id):
+        # PENDING records carry a local id until the ack returns the exchange id
+        del self.orders[o["id"]]
+        self.by_token[o["token_id"]].discard(o["id"])
+        o["id"] = order_id
+        self.orders[order_id] = o
+        self.by_token[o["token_id"]].add(order_id)
+
+    async def submit(self, token_id, side, price, size, tag="take"):
+        o = {
+            "id": f"pending-{time.time_ns()}",
+            "token_id": token_id,
+            "side": side,
+            "price": price,
+            "size": size,
+            "filled": 0.0,
+            "state": PENDING,
+            "tag": tag,
+            "origin_price": price,
+            "tick": await self.tick_size(token_id),
+            "created": time.time(),
+            "updated": time.time(),
+        }
+        self.orders[o["id"]] = o
+        self.by_token[token_id].add(o["id"])
+        try:
+            resp = await self.gateway.place(token_id, side, price, size)
+        except Exception:
+            self._transition(o, REJECTED)
+            raise
+        for cb in self.ack_listeners:
+            cb(token_id, side, price, size, resp)
+        if not isinstance(resp, dict) or not resp.get("success") or not resp.get("orderID"):
+            self._transition(o, REJECTED)
+            return resp
+        self._rekey(o, str(resp["orderID"]))
+        acked = filled_shares(side, resp)
+        early = self.early_fills.pop(o["id"], (0.0, 0.0))[0]
+        if acked > early + 1e-9:
+            # the user channel will report these same trades again: don't count them twice
+            self.ack_credit[o["id"]] = acked - early
+        matched = max(acked, early)
+        if matched > 0:
+            self._apply_fill(o, matched)
+        else:
+            self._transition(o, LIVE)
+        return resp
+
+    def on_order(self, row):
+        """User-channel order event (fill_stream row shape)."""
+        o = self.orders.get(row["id"])
+        if o is None:
+            return
+        status = row["status"]
+        if status == "CANCELED":
+            self._transition(o, CANCELLED)
+        elif status in ("LIVE", "PARTIALLY_FILLED", "MATCHED") and o["state"] == PENDING:
+            self._transition(o, LIVE)
+
+    def on_fill(self, fill):
+        o = self.orders.get(fill["order_id"])
+        if o is not None:
+            size = fill["size"]
+            credit = self.ack_credit.get(o["id"], 0.0)
+            if credit > 0:
+                seen = min(credit, size)
+                size -= seen
+                if credit - seen > 1e-9:
+                    self.ack_credit[o["id"]] = credit - seen
+                else:
+                    del self.ack_credit[o["id"]]
+            if size > 1e-9:
+                self._apply_fill(o, size)
+        elif any(p["state"] == PENDING for p in self.active(fill["token_id"])):
+            shares, first_seen = self.early_fills.get(fill["order_id"], (0.0, time.time()))
+            self.early_fills[fill["order_id"]] = (shares + fill["size"], first_seen)
+
+    # ---- cancel / replace -------------------------------------------------
+
+    async def cancel_many(self, order_ids):
+        """One DELETE /orders for any number of orders, across tokens. Returns the ids actually cancelled."""
+        ids = [i for i in order_ids if i in self.orders and self.orders[i]["state"] in ACTIVE and not i.startswith("pending-")]
+        if not ids:
+            return []
+        resp = await self.gateway.call(self.gateway.client.cancel_orders, ids)
+        done = [str(i) for i in (resp or {}).get("canceled") or []]
+        for oid in done:
+            if oid in self.orders and self._transition(self.orders[oid], CANCELLED):
+                self.cancelled += 1
+        return done
+
+    async def cancel_token(self, token_id):
+        return await self.cancel_many([o["id"] for o in self.active(token_id)])
+
+    async def cancel_all(self):
+        """Cancel every active order, after waiting out in-flight per-token tasks (a requote mid
+        cancel/replace) so an order they post is not missed."""
+        busy = [t for t in self.gateway.inflight.values() if t is not asyncio.current_task()]
+        if busy:
+            await asyncio.wait(busy)
+        return await self.cancel_many([o["id"] for o in self.active()])
+
+    async def replace(self, order_id, price, size=None):
+        """Cancel, and only once the cancel is confirmed post the new order with the unfilled remainder."""
+        o = self.orders.get(order_id)
+        if o is None or o["state"] not in (LIVE, PARTIALLY_FILLED):
+            return None
+        remaining = round(o["size"] - o["filled"], 2) if size is None else size
+        if order_id not in await self.cancel_many([order_id]):
+            return None  # filled or already gone: nothing to replace
+        if remaining <= 0:
+            return None
+        if self.risk is not None:
+            # checked after the cancel released the old order's exposure; blocked (or SAFE MODE) = stay pulled
+            blocked = self.risk.check(o["token_id"], o["side"], remaining * price)
+            if blocked:
+                print(f"  {RISK_LIMIT_EXCEEDED} requote {o['token_id'][:8]}...: {blocked}")
+                return None
+        resp = await self.submit(o["token_id"], o["side"], price, remaining, tag=o["tag"])
+        new = self.orders.get(str((resp or {}).get("orderID")))
+        if new is not None:
+            # a chased quote keeps its origin and age, so MAX_CHASE and QUOTE_TTL_SEC still bound it
+            new["origin_price"] = o["origin_price"]
+            new["created"] = o["created"]
+        self.replaced += 1
+        return resp
+
+    def requote_target(self, o, best_bid, best_ask):
+        """Where a resting quote should be given the current top of book; None = leave it, 0 = pull it."""
+        if time.time() - o["created"] > QUOTE_TTL_SEC:
+            return 0
+        tick = o.get("tick") or self.tick
+        if o["side"] == "BUY":
+            target = best_bid
+            if target >= best_ask:  # never cross
+                target = best_ask - tick
+        else:
+            target = best_ask
+            if target <= best_bid:
+                target = best_bid + tick
+        target = round(target, 4)
+        if abs(target - o["price"]) < tick / 2:
+            return None
+        if abs(target - o["origin_price"]) > MAX_CHASE + 1e-9:
+            return 0
+        return target
+
+    async def requote(self, token_id, best_bid, best_ask):
+        """Keep our resting quotes on the current top of book: replace drifted ones, pull stale ones."""
+        pull = []
+        for o in self.quotes(token_id):
+            target = self.requote_target(o, best_bid, best_ask)
+            if target == 0:
+                pull.append(o["id"])
+            elif target is not None:
+                await self.replace(o["id"], target)
+        if pull:
+            await self.cancel_many(pull)
+
+    def needs_requote(self, token_id, best_bid, best_ask):
+        return any(self.requote_target(o, best_bid, best_ask) is not None for o in self.quotes(token_id))
+
+    async def sweep_stale(self, interval=5):
+        """Pull expired quotes on tokens whose book has gone quiet (no requote trigger), batched across
+        tokens, and drop early fills for orders whose ack never reached us (placed elsewhere, or lost)."""
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            for oid in [i for i, (_, seen) in self.early_fills.items() if now - seen > EARLY_FILL_TTL_SEC]:
+                del self.early_fills[oid]
+            stale = [o["id"] for o in self.active() if o["tag"] == "quote" and o["state"] in (LIVE, PARTIALLY_FILLED)
+                     and now - o["created"] > QUOTE_TTL_SEC and not self.gateway.busy(o["token_id"])]
+            if stale:
+                try:
+                    await self.cancel_many(stale)
+                except Exception as e:
+                    print(f"  STALE QUOTE SWEEP FAILED: {e}")
@@ -4,15 +4,25 @@ import os
 import json
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+
+import numpy as np
 from dotenv import load_dotenv
 from eth_account import Account
 from py_clob_client.client import ClobClient
-from py_clob_client.clob_types import BalanceAllowanceParams, AssetType
+
+from book_snapshot_dry_run import get_snapshotter
+from ledger import fetch_token, fetch_usdc, open_order_rows, reserved_orders
+from preflight_schema import PreflightCheck
 
 load_dotenv('/opt/polybot/.env')
 PK = os.getenv('POLYGON_WALLET_PRIVATE_KEY')
 HOST = 'https://clob.polymarket.com'
 CHAIN = 137
+# cap on concurrent per-token REST calls (balance + book are two calls per token)
+FETCH_CONCURRENCY = int(os.getenv('RECONCILE_FETCH_CONCURRENCY', '8'))
+_pool = None
 
 
 def now():
@@ -26,177 +36,185 @@ def get_client():
     return c, wallet
 
 
-def preflight_check(state_clean: bool):
-    """Dry-run preflight: fetch read-only book snapshot to compute numerics.
+def preflight_limits():
+    return {
+        # planned sizing for multiples (shares)
+        'planned_exit_size': float(os.getenv('PREFLIGHT_SIZE_SHARES', '10')),
+        'staleness_limit': int(os.getenv('PREFLIGHT_STALENESS_LIMIT', '15')),
+        'spread_limit_cents': float(os.getenv('PREFLIGHT_SPREAD_LIMIT_CENTS', '1')),
+        'depth_exit_mult': float(os.getenv('PREFLIGHT_DEPTH_EXIT_MULT', '5')),
+        'depth_3ticks_mult': float(os.getenv('PREFLIGHT_DEPTH_3TICKS_MULT', '10')),
+    }
+
+
+def score_rows(rows, state_clean: bool, limits=None, now_s=None):
+    """Preflight gates for every snapshot row in one vectorized pass.
 
-    Execution remains disabled; this is purely to replace BOOK_UNVERIFIED with
-    specific reason codes (STALE_BOOK/SPREAD_TOO_WIDE/EXIT_DEPTH_INSUFFICIENT).
+    Returns ({token_id: PreflightCheck}, ranked token_ids that pass every book gate, best first).
+    Execution remains disabled in dry-run, so can_trade stays False; the ranking is what a
+    router would use once it is enabled.
     """
-    reason_codes = []
-
-    # integrity
-    state_reconciliation_recent = True
-    divergence_resolved = bool(state_clean)
-    if not divergence_resolved:
-        reason_codes.append('STATE_DIVERGENCE')
-
-    # planned sizing for multiples (shares)
-    planned_exit_size = float(os.getenv('PREFLIGHT_SIZE_SHARES', '10'))
-    staleness_limit = int(os.getenv('PREFLIGHT_STALENESS_LIMIT', '15'))
-    spread_limit_cents = float(os.getenv('PREFLIGHT_SPREAD_LIMIT_CENTS', '1'))
-    depth_exit_mult = float(os.getenv('PREFLIGHT_DEPTH_EXIT_MULT', '5'))
-    depth_3ticks_mult = float(os.getenv('PREFLIGHT_DEPTH_3TICKS_MULT', '10'))
-
-    # liquidity defaults
-    orderbook_verification = False
-    exit_depth_sufficient = False
-    spread_within_threshold = False
-    staleness_seconds = 0
-    spread_cents = 0.0
-    exit_depth_multiple = 0.0
-    depth_3ticks_multiple = 0.0
-
-    # read-only snapshot (best effort)
-    snap_path = '/opt/polybot/rag_sources/book_snapshot_latest.json'
-    try:
-        import subprocess, json as _json
-        raw = subprocess.check_output(['env/bin/python3', '/opt/polybot/book_snapshot_dry_run.py'], cwd='/opt/polybot', timeout=25)
-        snap = _json.loads(raw.decode('utf-8'))
-        with open(snap_path, 'w', encoding='utf-8') as f:
-            f.write(_json.dumps(snap, indent=2))
-
-        # choose first row with bid+ask
-        row = None
-        for r in snap.get('rows', []):
-            if isinstance(r, dict) and r.get('best_bid_price') and r.get('best_ask_price'):
-                row = r
-                break
-        if row:
-            orderbook_verification = True
-            now_s = int(time.time())
-            lts = int(row.get('last_trade_ts') or 0)
-            staleness_seconds = (now_s - lts) if lts else 999999
-            spread_cents = max(0.0, (float(row['best_ask_price']) - float(row['best_bid_price'])) * 100.0)
-
-            # multiples: compare available depth to planned size
-            exit_depth_multiple = (float(row.get('best_bid_size') or 0.0) / planned_exit_size) if planned_exit_size > 0 else 0.0
-            depth_3ticks_multiple = (float(row.get('depth_3ticks_bid') or 0.0) / planned_exit_size) if planned_exit_size > 0 else 0.0
-
-            # gates
-            if staleness_seconds <= staleness_limit:
-                # fresh enough
-                pass
-            else:
-                reason_codes.append('STALE_BOOK')
-
-            if spread_cents <= spread_limit_cents:
-                spread_within_threshold = True
-            else:
-                reason_codes.append('SPREAD_TOO_WIDE')
-
-            if exit_depth_multiple >= depth_exit_mult and depth_3ticks_multiple >= depth_3ticks_mult:
-                exit_depth_sufficient = True
-            else:
-                reason_codes.append('EXIT_DEPTH_INSUFFICIENT')
+    lim = limits or preflight_limits()
+    now_s = now_s or int(time.time())
+    rows = [r for r in rows if isinstance(r, dict) and r.get('token_id')]
+    if not rows:
+        return {}, []
+    col = lambda k: np.array([float(r.get(k) or 0.0) for r in rows])
+    bid, ask = col('best_bid_price'), col('best_ask_price')
+    lts = col('last_trade_ts')
+    size = lim['planned_exit_size']
+
+    verified = (bid > 0) & (ask > 0)
+    staleness = np.where(lts > 0, now_s - lts, 999999).astype(int)
+    # round before comparing: (0.46 - 0.45) * 100 is 1.0000000000000009
+    spread_cents = np.round(np.maximum(0.0, ask - bid) * 100.0, 4)
+    exit_mult = np.round(col('best_bid_size') / size, 4) if size > 0 else np.zeros(len(rows))
+    d3_mult = np.round(col('depth_3ticks_bid') / size, 4) if size > 0 else np.zeros(len(rows))
+
+    fresh = staleness <= lim['staleness_limit']
+    spread_ok = spread_cents <= lim['spread_limit_cents']
+    depth_ok = (exit_mult >= lim['depth_exit_mult']) & (d3_mult >= lim['depth_3ticks_mult'])
+    qualified = verified & fresh & spread_ok & depth_ok
+
+    checks = {}
+    for i, r in enumerate(rows):
+        codes = [] if state_clean else ['STATE_DIVERGENCE']
+        if not verified[i]:
+            codes.append('BOOK_UNVERIFIED')
         else:
-            reason_codes.append('BOOK_UNVERIFIED')
-
+            if not fresh[i]:
+                codes.append('STALE_BOOK')
+            if not spread_ok[i]:
+                codes.append('SPREAD_TOO_WIDE')
+            if not depth_ok[i]:
+                codes.append('EXIT_DEPTH_INSUFFICIENT')
+        # execution stays disabled in dry-run
+        codes.append('EXECUTION_DISABLED')
+        v = bool(verified[i])
+        checks[r['token_id']] = PreflightCheck(
+            can_trade=False,
+            reason_codes=codes,
+            staleness_seconds=int(staleness[i]) if v else 0,
+            spread_cents=float(spread_cents[i]) if v else 0.0,
+            exit_depth_multiple=float(exit_mult[i]) if v else 0.0,
+            depth_3ticks_multiple=float(d3_mult[i]) if v else 0.0,
+            max_exposure_usd=0.0,
+            max_loss_usd=0.0,
+            time_stop_seconds=0,
+            orderbook_verification=v,
+            exit_depth_sufficient=bool(v and depth_ok[i]),
+            spread_within_threshold=bool(v and spread_ok[i]),
+            state_reconciliation_recent=True,
+            divergence_resolved=bool(state_clean),
+        )
+
+    # best first: deepest 3-tick depth, then tightest spread, then freshest
+    order = np.lexsort((staleness, spread_cents, -d3_mult))
+    ranked = [rows[i]['token_id'] for i in order if qualified[i]] if state_clean else []
+    return checks, ranked
+
+
+def preflight_all(state_clean: bool, snapshotter=None):
+    """Per-token PreflightChecks for every candidate market plus the ranked tradeable set."""
+    try:
+        snap = (snapshotter or get_snapshotter()).snapshot()
+        rows = snap.get('rows', [])
     except Exception:
-        reason_codes.append('BOOK_UNVERIFIED')
+        rows = []
+    return score_rows(rows, state_clean)
 
-    # execution stays disabled in dry-run
-    reason_codes.append('EXECUTION_DISABLED')
 
-    can_trade = False
+def pick_check(checks, ranked, state_clean: bool):
+    """The best-qualified candidate's check (or the deepest verified one if none qualifies) as a flat dict."""
+    if ranked:
+        return asdict(checks[ranked[0]])
+    verified = [c for c in checks.values() if c.orderbook_verification]
+    if verified:
+        return asdict(max(verified, key=lambda c: (c.depth_3ticks_multiple, -c.spread_cents)))
+    reason_codes = ([] if state_clean else ['STATE_DIVERGENCE']) + ['BOOK_UNVERIFIED', 'EXECUTION_DISABLED']
+    return asdict(PreflightCheck(
+        can_trade=False, reason_codes=reason_codes, staleness_seconds=0, spread_cents=0.0,
+        exit_depth_multiple=0.0, depth_3ticks_multiple=0.0, max_exposure_usd=0.0, max_loss_usd=0.0,
+        time_stop_seconds=0, orderbook_verification=False, exit_depth_sufficient=False,
+        spread_within_threshold=False, state_reconciliation_recent=True, divergence_resolved=bool(state_clean),
+    ))
 
-    return {
-        'can_trade': can_trade,
-        'reason_codes': list(dict.fromkeys(reason_codes)),
-        'staleness_seconds': int(staleness_seconds),
-        'spread_cents': float(round(spread_cents, 4)),
-        'exit_depth_multiple': float(round(exit_depth_multiple, 4)),
-        'depth_3ticks_multiple': float(round(depth_3ticks_multiple, 4)),
-        'max_exposure_usd': 0.0,
-        'max_loss_usd': 0.0,
-        'time_stop_seconds': 0,
-        'orderbook_verification': bool(orderbook_verification),
-        'exit_depth_sufficient': bool(exit_depth_sufficient),
-        'spread_within_threshold': bool(spread_within_threshold),
-        'state_reconciliation_recent': bool(state_reconciliation_recent),
-        'divergence_resolved': bool(divergence_resolved),
-    }
 
+def preflight_check(state_clean: bool, snapshotter=None):
+    """Dry-run preflight in the flat dict form. Execution remains disabled."""
+    checks, ranked = preflight_all(state_clean, snapshotter)
+    return pick_check(checks, ranked, state_clean)
 
-def reconcile_state():
-    c, wallet = get_client()
-    issues = []
 
-    # USDC
-    coll = c.get_balance_allowance(BalanceAllowanceParams(asset_type=AssetType.COLLATERAL, token_id='', signature_type=0))
-    wallet_usdc = int(coll.get('balance', '0')) / 1e6
+def fetch_open_orders(c, fills=None):
+    """Open orders from a connected `fill_stream.FillStream` table if given, else one get_orders() REST read."""
+    if fills is not None and fills.connected:
+        return fills.open_orders()
+    return open_order_rows(c)
 
-    # Open orders
-    orders = c.get_orders()
-    olist = orders.get('orders', orders) if isinstance(orders, dict) else (orders or [])
 
+def reservations(reserved):
     sell_reserved = defaultdict(float)
     buy_reserved_usdc = 0.0
     tracked_token_ids = set()
-
-    # Conservative reservation set (Selene): LIVE + PARTIALLY_FILLED
-    reserve_status = {'LIVE', 'PARTIALLY_FILLED'}
-
-    for o in olist:
-        status = str(o.get('status') or '').upper()
-        if status not in reserve_status:
-            continue
-        token_id = str(o.get('asset_id') or '')
-        side = str(o.get('side') or '').upper()
-        try:
-            orig = float(o.get('original_size') or 0)
-            matched = float(o.get('size_matched') or 0)
-            rem = max(0.0, orig - matched)
-            px = float(o.get('price') or 0)
-        except Exception:
-            continue
-
+    for token_id, side, rem, px, _ in reserved:
         if token_id:
             tracked_token_ids.add(token_id)
-
         if side == 'SELL' and token_id:
             sell_reserved[token_id] += rem
         elif side == 'BUY':
             buy_reserved_usdc += rem * px
+    return sell_reserved, buy_reserved_usdc, tracked_token_ids
+
 
+def fetch_token_balance(c, token_id):
+    try:
+        return fetch_token(c, token_id)
+    except Exception:
+        return 0.0
+
+
+def fetch_book_status(c, token_id):
+    # verify orderbook exists (no trade action)
+    try:
+        ob = c.get_order_book(token_id)
+        bids = getattr(ob, 'bids', []) or []
+        asks = getattr(ob, 'asks', []) or []
+        if not bids and not asks:
+            return 'STALE_OR_EMPTY'
+        return 'OK'
+    except Exception:
+        return '404_OR_ERROR'
+
+
+def fetch_tokens(c, token_ids):
+    """(wallet balance, book status) per token. All 2N calls go out concurrently (capped at
+    FETCH_CONCURRENCY); the result is keyed by token and assembled in sorted order."""
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY, thread_name_prefix='reconcile')
+    token_ids = sorted(token_ids)
+    balances = [_pool.submit(fetch_token_balance, c, t) for t in token_ids]
+    books = [_pool.submit(fetch_book_status, c, t) for t in token_ids]
+    return {t: (b.result(), s.result()) for t, b, s in zip(token_ids, balances, books)}
+
+
+def build_state(wallet_usdc, buy_reserved_usdc, sell_reserved, token_data, state_version=1):
+    """Assemble reconcile_state from fetched balances/books and order reservations (no I/O)."""
+    issues = []
     free_usdc = wallet_usdc - buy_reserved_usdc
     if free_usdc < -0.01:
         issues.append('BUY_USDC_OVERCOMMIT')
 
     token_rows = []
-    for token_id in sorted(tracked_token_ids):
-        try:
-            br = c.get_balance_allowance(BalanceAllowanceParams(asset_type=AssetType.CONDITIONAL, token_id=token_id, signature_type=0))
-            wallet_bal = int(br.get('balance', '0')) / 1e6
-        except Exception:
-            wallet_bal = 0.0
-
+    for token_id in sorted(token_data):
+        wallet_bal, book_status = token_data[token_id]
         reserved = sell_reserved[token_id]
         free_bal = wallet_bal - reserved
         if free_bal < -0.01:
             issues.append(f'POSITION_MISMATCH:{token_id[:10]}')
-
-        # verify orderbook exists (no trade action)
-        book_status = 'OK'
-        try:
-            ob = c.get_order_book(token_id)
-            bids = getattr(ob, 'bids', []) or []
-            asks = getattr(ob, 'asks', []) or []
-            if not bids and not asks:
-                book_status = 'STALE_OR_EMPTY'
-        except Exception:
-            book_status = '404_OR_ERROR'
-            if wallet_bal > 0:
-                issues.append(f'UNEXITABLE_INVENTORY:{token_id[:10]}')
+        if book_status == '404_OR_ERROR' and wallet_bal > 0:
+            issues.append(f'UNEXITABLE_INVENTORY:{token_id[:10]}')
 
         token_rows.append({
             'token_id': token_id,
@@ -211,7 +229,7 @@ def reconcile_state():
     # Selene reconcile_state schema (verbatim)
     state = {
         'ts': now(),
-        'state_version': 1,
+        'state_version': state_version,
         'wallet_usdc': round(wallet_usdc, 6),
         'buy_reserved_usdc': round(buy_reserved_usdc, 6),
         'free_usdc': round(free_usdc, 6),
@@ -222,7 +240,25 @@ def reconcile_state():
     return state
 
 
+def reconcile_state(fills=None, client=None):
+    """Build reconcile_state. With a connected `fill_stream.FillStream`, open orders come from its
+    in-memory table instead of a get_orders() REST read."""
+    c = client or get_client()[0]
+    wallet_usdc = fetch_usdc(c)
+    sell_reserved, buy_reserved_usdc, tracked_token_ids = reservations(reserved_orders(fetch_open_orders(c, fills)))
+    token_data = fetch_tokens(c, sorted(tracked_token_ids))
+    return build_state(wallet_usdc, buy_reserved_usdc, sell_reserved, token_data)
+
+
 if __name__ == '__main__':
     state = reconcile_state()
-    pf = preflight_check(state.get('state_clean', False))
-    print(json.dumps({'reconcile_state': state, 'preflight_check': pf}, indent=2))
+    checks, ranked = preflight_all(state.get('state_clean', False))
+    pf = pick_check(checks, ranked, state.get('state_clean', False))
+    with open('/opt/polybot/rag_sources/book_snapshot_latest.json', 'w', encoding='utf-8') as f:
+        f.write(json.dumps(get_snapshotter().last, indent=2))
+    print(json.dumps({
+        'reconcile_state': state,
+        'preflight_check': pf,
+        'preflight_by_token': {t: asdict(c) for t, c in checks.items()},
+        'tradeable_ranked': ranked,
+    }, indent=2))
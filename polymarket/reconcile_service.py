@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Continuous reconcile service (paused mode, no trading).
+
+Keeps the last reconcile_state in memory and, each cycle, re-queries only what can have
+moved: tokens whose open orders changed (or whose fills/orders the user channel reported),
+and USDC when any order or fill changed. A full refresh still runs every
+RECONCILE_FULL_REFRESH_SEC to catch changes made outside our orders. Emits one JSON line
+of diffs per change; `state_version` advances only when the state actually changed.
+
+Burst mode: while a token shows a divergence issue (POSITION_MISMATCH, UNEXITABLE_INVENTORY;
+BUY_USDC_OVERCOMMIT for USDC) or just had a fill/order change, the loop drops to
+RECONCILE_BURST_SEC and re-queries only those tokens, then returns to the slow cadence once
+the state is clean. A divergence that outlives RECONCILE_BURST_MAX_SEC stops bursting until
+it clears, so a real mismatch does not pin the loop at high frequency.
+"""
+import argparse
+import json
+import os
+import time
+
+from reconcile_dry_run import build_state, fetch_open_orders, fetch_tokens, fetch_usdc, get_client, reservations, reserved_orders
+
+RECONCILE_SEC = float(os.getenv('RECONCILE_SEC', '2'))
+FULL_REFRESH_SEC = float(os.getenv('RECONCILE_FULL_REFRESH_SEC', '60'))
+BURST_SEC = float(os.getenv('RECONCILE_BURST_SEC', '0.25'))
+BURST_MAX_SEC = float(os.getenv('RECONCILE_BURST_MAX_SEC', '10'))
+BURST_FILL_SEC = float(os.getenv('RECONCILE_BURST_FILL_SEC', '2'))  # balances can lag a fill on REST
+STATE_PATH = os.getenv('RECONCILE_STATE_PATH', '/opt/polybot/rag_sources/reconcile_state_latest.json')
+
+SUMMARY_FIELDS = ('wallet_usdc', 'buy_reserved_usdc', 'free_usdc', 'state_clean')
+DIVERGENCE = ('POSITION_MISMATCH', 'UNEXITABLE_INVENTORY', 'BUY_USDC_OVERCOMMIT')
+USDC = ''  # burst key for the collateral balance
+
+
+def diff_states(old, new):
+    """Field-level differences between two reconcile_states (ts/state_version ignored)."""
+    if old is None:
+        return [{'op': 'init'}]
+    out = []
+    for k in SUMMARY_FIELDS:
+        if old[k] != new[k]:
+            out.append({'op': 'changed', 'field': k, 'old': old[k], 'new': new[k]})
+    old_rows = {r['token_id']: r for r in old['tokens']}
+    new_rows = {r['token_id']: r for r in new['tokens']}
+    for tid in sorted(old_rows.keys() | new_rows.keys()):
+        a, b = old_rows.get(tid), new_rows.get(tid)
+        if a is None:
+            out.append({'op': 'added', 'token_id': tid, 'row': b})
+        elif b is None:
+            out.append({'op': 'removed', 'token_id': tid})
+        else:
+            changed = {k: [a[k], b[k]] for k in b if a.get(k) != b[k]}
+            if changed:
+                out.append({'op': 'changed', 'token_id': tid, 'fields': changed})
+    for issue in sorted(set(new['issues']) - set(old['issues'])):
+        out.append({'op': 'issue_raised', 'issue': issue})
+    for issue in sorted(set(old['issues']) - set(new['issues'])):
+        out.append({'op': 'issue_cleared', 'issue': issue})
+    return out
+
+
+def diverged_keys(state):
+    """Burst keys (token ids, USDC) named by divergence issues; issues carry a 10-char token prefix."""
+    prefixes = set()
+    keys = set()
+    for issue in state['issues']:
+        code, _, prefix = issue.partition(':')
+        if code not in DIVERGENCE:
+            continue
+        if code == 'BUY_USDC_OVERCOMMIT':
+            keys.add(USDC)
+        else:
+            prefixes.add(prefix)
+    keys.update(r['token_id'] for r in state['tokens'] if r['token_id'][:10] in prefixes)
+    return keys
+
+
+def order_signatures(reserved):
+    """token_id -> comparable snapshot of its reserving orders."""
+    sig = {}
+    for token_id, side, rem, px, oid in reserved:
+        sig.setdefault(token_id, []).append((oid, side, round(rem, 6), px))
+    return {t: tuple(sorted(v)) for t, v in sig.items()}
+
+
+class ReconcileService:
+    def __init__(self, client, fills=None, full_refresh_sec=FULL_REFRESH_SEC):
+        self.client = client
+        self.fills = fills  # optional connected fill_stream.FillStream
+        self.full_refresh_sec = full_refresh_sec
+        self.state = None
+        self.state_version = 0
+        self.wallet_usdc = None
+        self.token_data = {}  # token_id -> (wallet balance, book status)
+        self.order_sig = {}
+        self.seen_token_version = {}
+        self.seen_fills_version = None
+        self.full_at = 0.0
+        self.queries = 0  # per-token fetches issued
+        self.cycles = 0
+        self.diverged_since = {}  # burst key -> first seen diverged
+        self.exhausted = set()  # keys that diverged past BURST_MAX_SEC: no burst until they clear
+        self.fill_burst = {}  # burst key -> until (after a fill/order change)
+        self.burst = set()  # keys forced into the next cycle
+
+    def cadence(self, slow=RECONCILE_SEC):
+        return BURST_SEC if self.burst else slow
+
+    def _plan_burst(self, state, touched):
+        now = time.time()
+        diverged = diverged_keys(state)
+        self.exhausted &= diverged
+        self.diverged_since = {k: self.diverged_since.get(k, now) for k in diverged}
+        for k, since in self.diverged_since.items():
+            if now - since > BURST_MAX_SEC and k not in self.exhausted:
+                self.exhausted.add(k)
+                print(json.dumps({'ts': int(now), 'burst_exhausted': k or 'USDC'}), flush=True)
+        for k in touched:
+            self.fill_burst[k] = now + BURST_FILL_SEC
+        self.fill_burst = {k: until for k, until in self.fill_burst.items() if until > now}
+        self.burst = (diverged - self.exhausted) | set(self.fill_burst)
+
+    def _stream_dirty(self):
+        """Tokens the user channel touched since the last cycle (empty without a stream), and the
+        versions to mark seen once this cycle's fetches have succeeded (None without a stream)."""
+        if self.fills is None or not self.fills.connected:
+            return set(), False, None
+        with self.fills.lock:
+            versions = dict(self.fills.token_version)
+            version = self.fills.version
+        dirty = {t for t, v in versions.items() if self.seen_token_version.get(t) != v}
+        return dirty, version != self.seen_fills_version, (versions, version)
+
+    def tick(self):
+        """One reconcile cycle. Returns the diffs (empty if nothing changed)."""
+        self.cycles += 1
+        reserved = reserved_orders(fetch_open_orders(self.client, self.fills))
+        sell_reserved, buy_reserved_usdc, tracked = reservations(reserved)
+        sig = order_signatures(reserved)
+        stream_dirty, stream_moved, seen = self._stream_dirty()
+
+        full = self.state is None or time.time() - self.full_at >= self.full_refresh_sec
+        orders_moved = sig != self.order_sig
+        changed = {t for t in sig.keys() | self.order_sig.keys() if sig.get(t) != self.order_sig.get(t)} | stream_dirty
+        if full:
+            dirty = set(tracked)
+        else:
+            dirty = {t for t in tracked if t not in self.token_data or t in changed or t in self.burst}
+
+        # change tracking is committed only after the fetches: if one raises, the next cycle
+        # still sees these moves and refetches instead of keeping a stale balance
+        if full or orders_moved or stream_moved or USDC in self.burst:
+            self.wallet_usdc = fetch_usdc(self.client)
+        if dirty:
+            self.token_data.update(fetch_tokens(self.client, sorted(dirty)))
+            self.queries += len(dirty)
+        self.order_sig = sig
+        if seen is not None:
+            self.seen_token_version, self.seen_fills_version = seen
+        self.token_data = {t: self.token_data[t] for t in tracked}
+        if full:
+            self.full_at = time.time()
+
+        state = build_state(self.wallet_usdc, buy_reserved_usdc, sell_reserved, self.token_data, self.state_version)
+        self._plan_burst(state, (changed | ({USDC} if orders_moved or stream_moved else set())) if self.state else set())
+        diffs = diff_states(self.state, state)
+        if diffs:
+            self.state_version += 1
+            state['state_version'] = self.state_version
+            self.state = state
+        else:
+            self.state['ts'] = state['ts']
+        return diffs
+
+    def write_state(self, path=STATE_PATH):
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.state, indent=2))
+        os.replace(tmp, path)
+
+    def run(self, cadence=RECONCILE_SEC, state_path=STATE_PATH):
+        while True:
+            t0 = time.perf_counter()
+            try:
+                diffs = self.tick()
+            except Exception as e:
+                print(json.dumps({'ts': int(time.time()), 'error': str(e)}), flush=True)
+                diffs = []
+            if diffs:
+                print(json.dumps({'ts': self.state['ts'], 'state_version': self.state_version, 'diffs': diffs,
+                                  'cycle_ms': round((time.perf_counter() - t0) * 1000, 1),
+                                  'burst': sorted(k or 'USDC' for k in self.burst)}), flush=True)
+                if state_path:
+                    try:
+                        self.write_state(state_path)
+                    except OSError as e:
+                        print(json.dumps({'ts': int(time.time()), 'error': f'state write failed: {e}'}), flush=True)
+            time.sleep(max(0.0, self.cadence(cadence) - (time.perf_counter() - t0)))
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Continuous incremental reconcile (dry-run, no trading)')
+    ap.add_argument('--cadence', type=float, default=RECONCILE_SEC)
+    ap.add_argument('--state-path', default=STATE_PATH, help="where to write the latest state on change ('' to disable)")
+    ap.add_argument('--stream', action='store_true', help='read orders/fills from the user channel instead of polling get_orders')
+    args = ap.parse_args()
+
+    c, wallet = get_client()
+    fills = None
+    if args.stream:
+        from fill_stream import FillStream
+        fills = FillStream(c.creds)
+        fills.seed_orders(c)
+        fills.start_thread()
+    print(json.dumps({'wallet': wallet, 'cadence': args.cadence, 'stream': bool(fills)}), flush=True)
+    ReconcileService(c, fills).run(args.cadence, args.state_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Pre-trade risk gate: running exposure / PnL / drawdown / loss-streak aggregates (mandate section 7).
+
+Every order-state change, fill and mark adjusts the aggregates by a delta, so both updates
+and `check()` are O(1) dictionary work with no I/O. Exposure is cost basis of open positions
+plus the unfilled notional of resting BUY orders. Exits (SELL) always pass; a drawdown or
+loss-streak breach trips SAFE MODE, which blocks new entries until `reset()`.
+"""
+import os
+import time
+from collections import defaultdict
+
+RISK_LIMIT_EXCEEDED = "RISK_LIMIT_EXCEEDED"
+
+MAX_TOTAL_EXPOSURE = float(os.getenv("RISK_MAX_TOTAL_EXPOSURE", "100"))
+MAX_MARKET_EXPOSURE = float(os.getenv("RISK_MAX_MARKET_EXPOSURE", "25"))
+DAILY_MAX_DRAWDOWN = float(os.getenv("RISK_DAILY_MAX_DRAWDOWN", "15"))
+MAX_CONSECUTIVE_LOSSES = int(os.getenv("RISK_MAX_CONSECUTIVE_LOSSES", "4"))
+DUST = 1e-6
+
+
+class RiskEngine:
+    def __init__(self, market_of=None, max_total=MAX_TOTAL_EXPOSURE, max_market=MAX_MARKET_EXPOSURE,
+                 max_drawdown=DAILY_MAX_DRAWDOWN, max_losses=MAX_CONSECUTIVE_LOSSES):
+        self.market_of = market_of or {}  # token_id -> market key (condition id); unknown tokens are their own market
+        self.max_total = max_total
+        self.max_market = max_market
+        self.max_drawdown = max_drawdown
+        self.max_losses = max_losses
+
+        self.positions = {}  # token_id -> {"shares", "cost", "upnl"}
+        self.pending = {}  # order_id -> (token_id, notional) for resting BUYs
+        self.market_exposure = defaultdict(float)
+        self.total_exposure = 0.0
+        self.realized = 0.0
+        self.unrealized = 0.0
+        self.day = int(time.time() // 86400)
+        self.day_peak = 0.0  # high-water mark of realized + unrealized since 00:00 UTC
+        self.loss_streak = 0
+        self.tripped = None  # reason once SAFE MODE is on
+        self.on_trip = []
+        self.blocked = 0
+
+    # ---- reads (hot path) -------------------------------------------------
+
+    def equity(self):
+        return self.realized + self.unrealized
+
+    def drawdown(self):
+        return self.day_peak - self.equity()
+
+    def check(self, token_id, side, notional):
+        """None if the order may go out, else why not. No I/O."""
+        if side == "SELL":
+            return None  # reducing risk is always allowed
+        reason = None
+        mkt = self.market_of.get(token_id, token_id)
+        if self.tripped:
+            reason = f"SAFE MODE ({self.tripped})"
+        elif self.total_exposure + notional > self.max_total + DUST:
+            reason = f"total exposure {self.total_exposure:.2f}+{notional:.2f} > {self.max_total:.2f}"
+        elif self.market_exposure[mkt] + notional > self.max_market + DUST:
+            reason = f"market exposure {self.market_exposure[mkt]:.2f}+{notional:.2f} > {self.max_market:.2f}"
+        if reason:
+            self.blocked += 1
+        return reason
+
+    def summary(self):
+        state = f"SAFE MODE ({self.tripped})" if self.tripped else "ok"
+        return (f"risk={state} exp={self.total_exposure:.2f} rpnl={self.realized:.2f} upnl={self.unrealized:.2f} "
+                f"dd={self.drawdown():.2f} streak={self.loss_streak} blocked={self.blocked}")
+
+    # ---- updates ----------------------------------------------------------
+
+    def _exposure(self, token_id, delta):
+        self.market_exposure[self.market_of.get(token_id, token_id)] += delta
+        self.total_exposure += delta
+
+    def _equity_moved(self):
+        day = int(time.time() // 86400)
+        if day != self.day:
+            self.day = day
+            self.day_peak = self.equity()
+        self.day_peak = max(self.day_peak, self.equity())
+        if self.drawdown() > self.max_drawdown + DUST:
+            self._trip(f"daily drawdown {self.drawdown():.2f} > {self.max_drawdown:.2f}")
+
+    def _trip(self, why):
+        if self.tripped:
+            return
+        self.tripped = why
+        for cb in self.on_trip:
+            cb(why)
+
+    def reset(self):
+        self.tripped = None
+        self.loss_streak = 0
+        self.day_peak = self.equity()
+
+    def on_order(self, order_id, token_id, side, price, remaining, active):
+        """Resting BUY notional counts toward exposure until it fills or is cancelled."""
+        if side != "BUY":
+            return
+        old = self.pending.pop(order_id, None)
+        if old:
+            self._exposure(old[0], -old[1])
+        if active and remaining > DUST:
+            self.pending[order_id] = (token_id, remaining * price)
+            self._exposure(token_id, remaining * price)
+
+    def on_fill(self, token_id, side, price, size):
+        p = self.positions.get(token_id)
+        if side == "BUY":
+            if p is None:
+                p = self.positions[token_id] = {"shares": 0.0, "cost": 0.0, "upnl": 0.0}
+            p["shares"] += size
+            p["cost"] += size * price
+            self._exposure(token_id, size * price)
+            return
+        if p is None or p["shares"] <= DUST:
+            return
+        closed = min(size, p["shares"])
+        basis = p["cost"] * closed / p["shares"]
+        pnl = closed * price - basis
+        p["shares"] -= closed
+        p["cost"] -= basis
+        self._exposure(token_id, -basis)
+        self.realized += pnl
+        # the closed slice's unrealized PnL is now realized
+        self.unrealized -= p["upnl"]
+        p["upnl"] = 0.0
+        if p["shares"] <= DUST:
+            del self.positions[token_id]
+        if pnl < 0:
+            self.loss_streak += 1
+            if self.loss_streak >= self.max_losses:
+                self._trip(f"{self.loss_streak} consecutive losses")
+        elif pnl > 0:
+            self.loss_streak = 0
+        self._equity_moved()
+
+    def mark(self, token_id, bid):
+        """Re-mark one held token at its best bid (what an exit would get)."""
+        p = self.positions.get(token_id)
+        if p is None or not bid:
+            return
+        upnl = p["shares"] * bid - p["cost"]
+        self.unrealized += upnl - p["upnl"]
+        p["upnl"] = upnl
+        self._equity_moved()
@@ -30,9 +30,12 @@ from datetime import datetime, timezone
 from collections import deque
 from dotenv import load_dotenv
 from py_clob_client.client import ClobClient
-from py_clob_client.clob_types import OrderArgs, OrderType
 from eth_account import Account
 
+from order_factory import OrderFactory
+from order_gateway import OrderGateway
+from risk import RISK_LIMIT_EXCEEDED, RiskEngine
+
 load_dotenv("/home/codespace/.openclaw/workspace/polymarket/.env")
 
 # ============================================================
@@ -56,6 +59,8 @@ STOP_LOSS = 0.04           # Cut loss at 4% below entry
 MAX_POSITION_USDC = 25.0   # Max per position
 MIN_SPREAD_BPS = 200       # Min spread (bps) to consider spread capture
 MIN_LIQUIDITY = 5000       # Min volume to consider a market
+# USDC committed per entry signal; exits are sized by the position
+ENTRY_USDC = {"DIP_BUY": min(MAX_POSITION_USDC, 20.0), "SPREAD_CAPTURE": min(MAX_POSITION_USDC, 15.0)}
 
 # ============================================================
 # SETUP CLOB CLIENT
@@ -222,39 +227,101 @@ class PriceTracker:
 # ============================================================
 # ORDER EXECUTION  
 # ============================================================
-def execute_buy(client, token_id, price, size_usdc):
-    """Place a buy order"""
+async def execute_buy(gateway, token_id, price, size_usdc):
+    """Place a buy order (signed + posted on the gateway pool)"""
     try:
         shares = size_usdc / price
-        order_args = OrderArgs(
-            price=price,
-            size=shares,
-            side="BUY",
-            token_id=token_id,
-        )
-        signed_order = client.create_order(order_args)
-        resp = client.post_order(signed_order, OrderType.GTC)
-        return resp
+        return await gateway.place(token_id, "BUY", price, shares)
     except Exception as e:
         print(f"  ❌ Buy order failed: {e}")
         return None
 
-def execute_sell(client, token_id, price, size_shares):
-    """Place a sell order"""
+async def execute_sell(gateway, token_id, price, size_shares):
+    """Place a sell order (signed + posted on the gateway pool)"""
     try:
-        order_args = OrderArgs(
-            price=price,
-            size=size_shares,
-            side="SELL",
-            token_id=token_id,
-        )
-        signed_order = client.create_order(order_args)
-        resp = client.post_order(signed_order, OrderType.GTC)
-        return resp
+        return await gateway.place(token_id, "SELL", price, size_shares)
     except Exception as e:
         print(f"  ❌ Sell order failed: {e}")
         return None
 
+def risk_gate(risk, asset_id, sig, market_q):
+    """True if the signal may trade; entries are checked at the notional they will post"""
+    side = "BUY" if sig["type"] in ENTRY_USDC else "SELL"
+    blocked = risk.check(asset_id, side, ENTRY_USDC.get(sig["type"], 0.0))
+    if blocked:
+        print(f"  ⛔ {RISK_LIMIT_EXCEEDED} {sig['type']} {market_q}: {blocked}")
+    return blocked is None
+
+async def handle_signal(gateway, tracker, risk, asset_id, sig, market_q):
+    """Act on one signal; runs as a gateway task so the WS loop never waits on the CLOB"""
+    now = datetime.now(timezone.utc).strftime("%H:%M:%S")
+    
+    if sig["type"] == "DIP_BUY":
+        print(f"\n  🔥 [{now}] DIP BUY SIGNAL: {market_q}")
+        print(f"     {sig['reason']}")
+        
+        # Execute buy
+        size = ENTRY_USDC["DIP_BUY"]
+        result = await execute_buy(gateway, asset_id, sig["price"], size)
+        if result:
+            shares = size / sig["price"]
+            risk.on_fill(asset_id, "BUY", sig["price"], shares)
+            tracker.positions[asset_id] = {
+                "entry_price": sig["price"],
+                "size": shares,
+                "side": "BUY",
+                "entry_time": time.time(),
+            }
+            print(f"     ✅ Bought {shares:.2f} shares @ ${sig['price']:.4f} = ${size:.2f}")
+            tracker.trades.append({
+                "time": now, "type": "BUY",
+                "market": market_q, "price": sig["price"],
+                "size": size
+            })
+    
+    elif sig["type"] == "SPREAD_CAPTURE":
+        print(f"\n  📐 [{now}] SPREAD SIGNAL: {market_q}")
+        print(f"     {sig['reason']}")
+        # For spread capture, place limit buy at bid
+        size = ENTRY_USDC["SPREAD_CAPTURE"]
+        result = await execute_buy(gateway, asset_id, sig["bid"], size)
+        if result:
+            shares = size / sig["bid"]
+            risk.on_fill(asset_id, "BUY", sig["bid"], shares)
+            tracker.positions[asset_id] = {
+                "entry_price": sig["bid"],
+                "size": shares,
+                "side": "BUY",
+                "entry_time": time.time(),
+                "target_sell": sig["ask"],
+            }
+            print(f"     ✅ Limit buy {shares:.2f} @ ${sig['bid']:.4f}")
+            tracker.trades.append({
+                "time": now, "type": "SPREAD_BUY",
+                "market": market_q, "price": sig["bid"],
+                "size": size
+            })
+    
+    elif sig["type"] in ("TAKE_PROFIT", "STOP_LOSS"):
+        pos = tracker.positions.get(asset_id)
+        if pos:
+            emoji = "💰" if sig["type"] == "TAKE_PROFIT" else "🛑"
+            print(f"\n  {emoji} [{now}] {sig['type']}: {market_q}")
+            print(f"     {sig['reason']}")
+            
+            result = await execute_sell(gateway, asset_id, sig["exit_price"], pos["size"])
+            if result:
+                pnl = (sig["exit_price"] - pos["entry_price"]) * pos["size"]
+                tracker.pnl += pnl
+                risk.on_fill(asset_id, "SELL", sig["exit_price"], pos["size"])
+                print(f"     ✅ Sold {pos['size']:.2f} @ ${sig['exit_price']:.4f} | Trade PnL: ${pnl:.4f} | Total: ${tracker.pnl:.4f}")
+                tracker.trades.append({
+                    "time": now, "type": "SELL",
+                    "market": market_q, "price": sig["exit_price"],
+                    "pnl": pnl
+                })
+                tracker.positions.pop(asset_id, None)
+
 # ============================================================
 # MAIN WEBSOCKET LOOP
 # ============================================================
@@ -266,6 +333,7 @@ async def run_scalper():
     
     # Setup
     client = setup_client()
+    gateway = OrderGateway(client, factory=OrderFactory(client))
     tracker = PriceTracker()
     
     account = Account.from_key(PRIVATE_KEY)
@@ -294,6 +362,14 @@ async def run_scalper():
         print(f"  📊 {m['question'][:60]}")
         print(f"     Price: ${m['yes_price']:.4f} | Vol: ${m['volume']:,.0f} | Liq: ${m['liquidity']:,.0f}")
     
+    # Running exposure / PnL / drawdown / loss-streak gate; entries stop once it trips
+    risk = RiskEngine(market_of={t: m["condition_id"] for t, m in token_to_market.items()})
+    risk.on_trip.append(lambda why: print(f"\n  🚨 SAFE MODE: {why} -- entries blocked"))
+    
+    # Pre-build order templates (tick size, neg-risk, fee rate) so signals only pay for signing
+    ready = await asyncio.gather(*(gateway.call(gateway.factory.prepare, t) for t in asset_ids), return_exceptions=True)
+    print(f"\n🧾 Order templates ready: {sum(not isinstance(r, Exception) for r in ready)}/{len(asset_ids)}")
+    
     # Connect to WebSocket
     print(f"\n🔌 Connecting to WebSocket...")
     
@@ -332,7 +408,7 @@ async def run_scalper():
                             msg_count += 1
                             if msg_count % 100 == 0:
                                 now = datetime.now(timezone.utc).strftime("%H:%M:%S")
-                                print(f"  [{now}] {msg_count} messages processed | Signals: {signal_count} | PnL: ${tracker.pnl:.4f}")
+                                print(f"  [{now}] {msg_count} messages processed | Signals: {signal_count} | PnL: ${tracker.pnl:.4f} | {gateway.stats_line()} | {risk.summary()}")
                             
                             if event_type == "book" and asset_id:
                                 bids = msg.get("bids", [])
@@ -346,77 +422,17 @@ async def run_scalper():
                                 
                                 # Check for signals
                                 if best_bid and best_ask:
+                                    risk.mark(asset_id, best_bid)
                                     signals = tracker.get_signals(asset_id, best_bid, best_ask)
                                     
                                     for sig in signals:
                                         signal_count += 1
-                                        market_info = token_to_market.get(asset_id, {})
-                                        market_q = market_info.get("question", "Unknown")[:50]
-                                        
-                                        now = datetime.now(timezone.utc).strftime("%H:%M:%S")
-                                        
-                                        if sig["type"] == "DIP_BUY":
-                                            print(f"\n  🔥 [{now}] DIP BUY SIGNAL: {market_q}")
-                                            print(f"     {sig['reason']}")
-                                            
-                                            # Execute buy
-                                            size = min(MAX_POSITION_USDC, 20.0)
-                                            result = execute_buy(client, asset_id, sig["price"], size)
-                                            if result:
-                                                shares = size / sig["price"]
-                                                tracker.positions[asset_id] = {
-                                                    "entry_price": sig["price"],
-                                                    "size": shares,
-                                                    "side": "BUY",
-                                                    "entry_time": time.time(),
-                                                }
-                                                print(f"     ✅ Bought {shares:.2f} shares @ ${sig['price']:.4f} = ${size:.2f}")
-                                                tracker.trades.append({
-                                                    "time": now, "type": "BUY",
-                                                    "market": market_q, "price": sig["price"],
-                                                    "size": size
-                                                })
-                                        
-                                        elif sig["type"] == "SPREAD_CAPTURE":
-                                            print(f"\n  📐 [{now}] SPREAD SIGNAL: {market_q}")
-                                            print(f"     {sig['reason']}")
-                                            # For spread capture, place limit buy at bid
-                                            size = min(MAX_POSITION_USDC, 15.0)
-                                            result = execute_buy(client, asset_id, sig["bid"], size)
-                                            if result:
-                                                shares = size / sig["bid"]
-                                                tracker.positions[asset_id] = {
-                                                    "entry_price": sig["bid"],
-                                                    "size": shares,
-                                                    "side": "BUY",
-                                                    "entry_time": time.time(),
-                                                    "target_sell": sig["ask"],
-                                                }
-                                                print(f"     ✅ Limit buy {shares:.2f} @ ${sig['bid']:.4f}")
-                                                tracker.trades.append({
-                                                    "time": now, "type": "SPREAD_BUY",
-                                                    "market": market_q, "price": sig["bid"],
-                                                    "size": size
-                                                })
-                                        
-                                        elif sig["type"] in ("TAKE_PROFIT", "STOP_LOSS"):
-                                            pos = tracker.positions.get(asset_id)
-                                            if pos:
-                                                emoji = "💰" if sig["type"] == "TAKE_PROFIT" else "🛑"
-                                                print(f"\n  {emoji} [{now}] {sig['type']}: {market_q}")
-                                                print(f"     {sig['reason']}")
-                                                
-                                                result = execute_sell(client, asset_id, sig["exit_price"], pos["size"])
-                                                if result:
-                                                    pnl = (sig["exit_price"] - pos["entry_price"]) * pos["size"]
-                                                    tracker.pnl += pnl
-                                                    print(f"     ✅ Sold {pos['size']:.2f} @ ${sig['exit_price']:.4f} | Trade PnL: ${pnl:.4f} | Total: ${tracker.pnl:.4f}")
-                                                    tracker.trades.append({
-                                                        "time": now, "type": "SELL",
-                                                        "market": market_q, "price": sig["exit_price"],
-                                                        "pnl": pnl
-                                                    })
-                                                    del tracker.positions[asset_id]
+                                        market_q = token_to_market.get(asset_id, {}).get("question", "Unknown")[:50]
+                                        if not risk_gate(risk, asset_id, sig, market_q):
+                                            continue
+                                        # duplicate signal while an order for this token is in flight -> dropped
+                                        if not gateway.spawn(asset_id, handle_signal(gateway, tracker, risk, asset_id, sig, market_q)):
+                                            break
                             
                             elif event_type == "price_change" and msg.get("price_changes"):
                                 for pc in msg["price_changes"]:
@@ -428,10 +444,10 @@ async def run_scalper():
                                         tracker.update(pc_asset, best_ask, time.time())
                                     
                                     if pc_asset and best_bid and best_ask:
+                                        risk.mark(pc_asset, best_bid)
                                         signals = tracker.get_signals(pc_asset, best_bid, best_ask)
                                         for sig in signals:
                                             signal_count += 1
-                                            market_info = token_to_market.get(pc_asset, {})
                                             now = datetime.now(timezone.utc).strftime("%H:%M:%S")
                                             print(f"  ⚡ [{now}] {sig['type']}: {sig['reason']}")
                             
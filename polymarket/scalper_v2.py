@@ -8,9 +8,15 @@ from datetime import datetime, timezone
 from collections import deque
 from dotenv import load_dotenv
 from py_clob_client.client import ClobClient
-from py_clob_client.clob_types import OrderArgs, OrderType, BalanceAllowanceParams, AssetType
 from eth_account import Account
 
+from order_factory import OrderFactory
+from order_gateway import OrderGateway, filled_shares
+from order_manager import ACTIVE, CANCELLED, OrderManager
+from risk import RISK_LIMIT_EXCEEDED, RiskEngine
+from ledger import Ledger
+from fill_stream import FillStream
+
 load_dotenv("/opt/polybot/.env")
 
 PRIVATE_KEY = os.getenv("POLYGON_WALLET_PRIVATE_KEY")
@@ -28,6 +34,8 @@ MAX_POSITION_USDC = 20.0
 MIN_SPREAD_PCT = 0.03
 SIGNAL_COOLDOWN = 60
 WARMUP_MESSAGES = 300
+# USDC committed per entry signal; exits are sized by the position
+ENTRY_USDC = {"DIP_BUY": min(MAX_POSITION_USDC, 20.0), "SPREAD_CAPTURE": min(MAX_POSITION_USDC, 15.0)}
 
 def setup_client(funder):
     # IMPORTANT: use the same signature_type + funder path as go_live.py
@@ -200,35 +208,24 @@ def clamp_price(price):
     return round(min(0.99, max(0.01, float(price))), 4)
 
 
-def get_token_balance(client, token_id):
-    try:
-        params = BalanceAllowanceParams(
-            asset_type=AssetType.CONDITIONAL,
-            token_id=token_id,
-            signature_type=0,
-        )
-        r = client.get_balance_allowance(params)
-        bal = int(r.get("balance", "0"))
-        # conditional token balance is in 1e6 precision
-        return bal / 1e6
-    except Exception as e:
-        print(f"  BALANCE CHECK FAILED ({token_id[:8]}...): {e}")
-        return 0.0
-
+class Runtime:
+    """Everything a signal handler needs; built once in run_scalper."""
 
-def get_usdc_balance(client):
-    try:
-        params = BalanceAllowanceParams(asset_type=AssetType.COLLATERAL, token_id="", signature_type=0)
-        r = client.get_balance_allowance(params)
-        return int(r.get("balance", "0")) / 1e6
-    except Exception as e:
-        print(f"  USDC BALANCE CHECK FAILED: {e}")
-        return 0.0
+    def __init__(self, gateway, ledger, tracker, fills, orders, risk):
+        self.gateway = gateway
+        self.orders = orders
+        self.risk = risk
+        self.ledger = ledger
+        self.tracker = tracker
+        self.fills = fills
+        self.token_map = {}
+        self.ack_booked = {}  # order_id -> shares booked from an ack that the user channel may still report
+        self.background = []  # long-running tasks; held here so the loop's weak refs don't drop them
 
 
-def execute_buy(client, token_id, price, size_usdc):
+async def execute_buy(rt, token_id, price, size_usdc, tag="take"):
     try:
-        available = get_usdc_balance(client)
+        available = rt.ledger.free_usdc()
         if available <= 0.2:
             print("  BUY SKIP: insufficient USDC available")
             return None, None, 0.0
@@ -241,20 +238,19 @@ def execute_buy(client, token_id, price, size_usdc):
 
         px = clamp_price(price)
         shares = round(safe_size / px, 2)
-        order_args = OrderArgs(price=px, size=shares, side="BUY", token_id=token_id)
-        signed = client.create_order(order_args)
-        resp = client.post_order(signed, OrderType.GTC)
+        resp = await rt.orders.submit(token_id, "BUY", px, shares, tag=tag)
+        assume_filled(rt, resp, token_id, "BUY", px, shares)
         return resp, px, safe_size
     except Exception as e:
         print(f"  BUY FAILED: {e}")
         return None, None, 0.0
 
 
-def execute_sell(client, token_id, price, size_shares):
+async def execute_sell(rt, token_id, price, size_shares):
     try:
         px = clamp_price(price)
         sz = round(size_shares, 2)
-        onchain_bal = get_token_balance(client, token_id)
+        onchain_bal = rt.ledger.free_tokens(token_id)
         if onchain_bal <= 0:
             print(f"  SELL SKIP: no token balance for {token_id[:8]}...")
             return None, px
@@ -263,15 +259,125 @@ def execute_sell(client, token_id, price, size_shares):
             print(f"  SELL SKIP: computed size 0 for {token_id[:8]}...")
             return None, px
 
-        order_args = OrderArgs(price=px, size=sell_size, side="SELL", token_id=token_id)
-        signed = client.create_order(order_args)
-        resp = client.post_order(signed, OrderType.GTC)
+        resp = await rt.orders.submit(token_id, "SELL", px, sell_size)
+        assume_filled(rt, resp, token_id, "SELL", px, sell_size)
         return resp, px
     except Exception as e:
         print(f"  SELL FAILED: {e}")
         return None, None
 
 
+def assume_filled(rt, resp, token_id, side, px, size):
+    # without the user channel there is no fill signal: fall back to booking what the ack says matched
+    if rt.fills.connected or not isinstance(resp, dict):
+        return
+    matched = min(size, filled_shares(side, resp))
+    if matched <= 0:
+        return
+    order_id = str(resp.get("orderID") or f"local-{time.time_ns()}")
+    rt.ack_booked[order_id] = rt.ack_booked.get(order_id, 0.0) + matched
+    on_fill(rt, {"trade_id": f"ack-{order_id}", "order_id": order_id, "token_id": token_id, "side": side, "price": px, "size": matched, "ts": int(time.time())})
+
+
+def on_stream_fill(rt, fill):
+    # the stream only counts as connected once its first event arrives, so an order acked just
+    # before that may already be booked by assume_filled: book only what the ack did not cover
+    credit = rt.ack_booked.pop(fill["order_id"], 0.0)
+    if credit > 0:
+        seen = min(credit, fill["size"])
+        if credit - seen > 1e-9:
+            rt.ack_booked[fill["order_id"]] = credit - seen
+        if fill["size"] - seen <= 1e-9:
+            return
+        fill = {**fill, "size": fill["size"] - seen}
+    on_fill(rt, fill)
+
+
+def on_fill(rt, fill):
+    """Positions, PnL and the ledger move on fills (user channel, or the ack fallback above)."""
+    tracker = rt.tracker
+    aid, px, sz = fill["token_id"], fill["price"], fill["size"]
+    rt.ledger.on_fill(fill["order_id"], aid, fill["side"], px, sz)
+    rt.risk.on_fill(aid, fill["side"], px, sz)
+    mq = rt.token_map.get(aid, {}).get("question", "?")[:50]
+    now_s = datetime.now(timezone.utc).strftime("%H:%M:%S")
+
+    if fill["side"] == "BUY":
+        pos = tracker.positions.get(aid)
+        if pos:
+            total = pos["size"] + sz
+            pos["entry_price"] = (pos["entry_price"] * pos["size"] + px * sz) / total
+            pos["size"] = total
+        else:
+            pos = tracker.positions[aid] = {"entry_price": px, "size": sz, "entry_time": time.time()}
+        print(f"     FILL BUY {sz:.2f} @ ${px:.4f} | pos {pos['size']:.2f} @ ${pos['entry_price']:.4f} | {mq}")
+        tracker.trades.append({"time": now_s, "type": "BUY", "market": mq, "price": px, "size": sz * px})
+        asyncio.get_running_loop().create_task(presign_exits(rt.gateway, aid, pos["size"], pos["entry_price"]))
+
+    elif fill["side"] == "SELL":
+        pos = tracker.positions.get(aid)
+        if not pos:
+            return
+        closed = min(sz, pos["size"])
+        pnl = (px - pos["entry_price"]) * closed
+        tracker.pnl += pnl
+        pos["size"] -= closed
+        print(f"     FILL SELL {closed:.2f} @ ${px:.4f} | PnL: ${pnl:.4f} | Total: ${tracker.pnl:.4f} | {mq}")
+        tracker.trades.append({"time": now_s, "type": "SELL", "market": mq, "pnl": pnl})
+        rt.gateway.factory.drop_exits(aid)
+        if pos["size"] <= 0.005:
+            del tracker.positions[aid]
+        else:
+            asyncio.get_running_loop().create_task(presign_exits(rt.gateway, aid, pos["size"], pos["entry_price"]))
+
+
+def safe_mode(rt, why):
+    # mandate: on a risk breach stop entering and pull every resting order; exits keep running
+    print(f"\n  SAFE MODE: {why} -- cancelling all open orders, entries blocked")
+    asyncio.get_running_loop().create_task(rt.orders.cancel_all())
+
+
+async def presign_exits(gateway, token_id, shares, entry):
+    # sign the TP/SL sell ladder now so the exit is post-only when it fires
+    try:
+        n = await gateway.factory.presign_exits_async(token_id, round(shares, 2), entry, PROFIT_TARGET, STOP_LOSS)
+        print(f"     exit ladder pre-signed ({n} rungs)")
+    except Exception as e:
+        print(f"  PRESIGN FAILED ({token_id[:8]}...): {e}")
+
+
+async def handle_signal(rt, aid, sig, mq):
+    # runs as a gateway task: the WS loop keeps consuming market data while this awaits the ack
+    now_s = datetime.now(timezone.utc).strftime("%H:%M:%S")
+
+    if sig["type"] == "DIP_BUY":
+        print(f"\n  DIP [{now_s}] {mq}")
+        print(f"     {sig['reason']}")
+        result, px, used_size = await execute_buy(rt, aid, sig["price"], ENTRY_USDC["DIP_BUY"])
+        if result and px:
+            print(f"     BUY POSTED {used_size / px:.2f} @ ${px:.4f} = ${used_size:.2f}")
+
+    elif sig["type"] == "SPREAD_CAPTURE":
+        print(f"\n  SPREAD [{now_s}] {mq}")
+        print(f"     {sig['reason']}")
+        # resting bid: the order manager keeps it on the best bid until it fills or ages out
+        result, px, used_size = await execute_buy(rt, aid, sig["bid"], ENTRY_USDC["SPREAD_CAPTURE"], tag="quote")
+        if result and px:
+            print(f"     LIMIT BUY {used_size / px:.2f} @ ${px:.4f}")
+            if aid in rt.tracker.positions:
+                rt.tracker.positions[aid]["target"] = sig["ask"]
+
+    elif sig["type"] in ("TAKE_PROFIT", "STOP_LOSS"):
+        pos = rt.tracker.positions.get(aid)
+        if pos:
+            tag = "PROFIT" if sig["type"] == "TAKE_PROFIT" else "STOP"
+            print(f"\n  {tag} [{now_s}] {mq}")
+            print(f"     {sig['reason']}")
+            result, px = await execute_sell(rt, aid, sig["exit_price"], pos["size"])
+            if result and px:
+                print(f"     SELL POSTED {pos['size']:.2f} @ ${px:.4f}")
+
+
 async def run_scalper():
     print("=" * 60)
     print("POLYMARKET SCALPER v2 - Amsterdam")
@@ -282,16 +388,9 @@ async def run_scalper():
     print(f"Wallet: {account.address}")
 
     client = setup_client(funder=account.address)
+    gateway = OrderGateway(client, factory=OrderFactory(client))
     tracker = PriceTracker()
 
-    # quick collateral sanity check (USDC)
-    try:
-        params = BalanceAllowanceParams(asset_type=AssetType.COLLATERAL, token_id="", signature_type=0)
-        r = client.get_balance_allowance(params)
-        print(f"USDC Balance/Allowance: {r}")
-    except Exception as e:
-        print(f"USDC balance check failed: {e}")
-
     print("\nFinding hot markets...")
     hot_markets = find_hot_markets(15)
     if not hot_markets:
@@ -311,6 +410,40 @@ async def run_scalper():
         print(f"  {q}")
         print(f"    Price: ${m['yes_price']:.2f} | Vol: ${m['volume']:,.0f} | Liq: ${m['liquidity']:,.0f}")
 
+    # seed the local ledger once; pre-trade checks never hit REST after this
+    ledger = Ledger(book_ack_matches=False)
+    try:
+        await gateway.call(ledger.seed, client, asset_ids)
+        print(f"Ledger seeded: {ledger.summary()}")
+    except Exception as e:
+        print(f"Ledger seed failed: {e}")
+        return
+
+    # user channel: fills drive positions + ledger as they happen
+    fills = FillStream(client.creds, markets=sorted({m["condition_id"] for m in hot_markets if m["condition_id"]}))
+    risk = RiskEngine(market_of={t: m["condition_id"] for t, m in token_map.items()})
+    orders = OrderManager(gateway, risk=risk)
+    rt = Runtime(gateway, ledger, tracker, fills, orders, risk)
+    rt.token_map = token_map
+    fills.subscribe(on_fill=orders.on_fill, on_order=orders.on_order)
+    fills.subscribe(on_fill=lambda f: on_stream_fill(rt, f))
+    # every post (replacements included) reserves in the ledger; a confirmed cancel releases it
+    orders.subscribe(
+        on_change=lambda o, old, new: ledger.on_order_closed(o["id"]) if new == CANCELLED else None,
+        on_ack=ledger.on_ack,
+    )
+    orders.subscribe(on_change=lambda o, old, new: risk.on_order(o["id"], o["token_id"], o["side"], o["price"], o["size"] - o["filled"], new in ACTIVE))
+    risk.on_trip.append(lambda why: safe_mode(rt, why))
+    rt.background = [
+        asyncio.create_task(ledger.reconcile_loop(gateway)),
+        asyncio.create_task(fills.run()),
+        asyncio.create_task(orders.sweep_stale()),
+    ]
+
+    # resolve tick size / neg-risk / fee rate per token before the first signal can fire
+    ready = await asyncio.gather(*(gateway.call(gateway.factory.prepare, t) for t in asset_ids), return_exceptions=True)
+    print(f"Order templates ready: {sum(not isinstance(r, Exception) for r in ready)}/{len(asset_ids)}")
+
     subscribe_msg = {"assets_ids": asset_ids, "type": "MARKET", "custom_feature_enabled": True}
 
     while True:
@@ -338,7 +471,7 @@ async def run_scalper():
                             if tracker.msg_count % 500 == 0:
                                 now_s = datetime.now(timezone.utc).strftime("%H:%M:%S")
                                 print(
-                                    f"[{now_s}] msgs={tracker.msg_count} | pos={len(tracker.positions)} | trades={len(tracker.trades)} | PnL=${tracker.pnl:.4f}"
+                                    f"[{now_s}] msgs={tracker.msg_count} | pos={len(tracker.positions)} | trades={len(tracker.trades)} | PnL=${tracker.pnl:.4f} | {gateway.stats_line()} | {ledger.summary()} | {orders.summary()} | {risk.summary()} | fills={'ws' if fills.connected else 'ack'}"
                                 )
 
                             best_bid = best_ask = None
@@ -372,48 +505,23 @@ async def run_scalper():
                             if not (aid and best_bid and best_ask):
                                 continue
 
+                            risk.mark(aid, best_bid)
                             signals = tracker.get_signals(aid, best_bid, best_ask)
 
                             for sig in signals:
-                                minfo = token_map.get(aid, {})
-                                mq = minfo.get("question", "?")[:50]
-                                now_s = datetime.now(timezone.utc).strftime("%H:%M:%S")
-
-                                if sig["type"] == "DIP_BUY":
-                                    print(f"\n  DIP [{now_s}] {mq}")
-                                    print(f"     {sig['reason']}")
-                                    size = min(MAX_POSITION_USDC, 20.0)
-                                    result, px, used_size = execute_buy(client, aid, sig["price"], size)
-                                    if result and px:
-                                        shares = used_size / px
-                                        tracker.positions[aid] = {"entry_price": px, "size": shares, "entry_time": time.time()}
-                                        print(f"     BOUGHT {shares:.2f} @ ${px:.4f} = ${used_size:.2f}")
-                                        tracker.trades.append({"time": now_s, "type": "BUY", "market": mq, "price": px, "size": used_size})
-
-                                elif sig["type"] == "SPREAD_CAPTURE":
-                                    print(f"\n  SPREAD [{now_s}] {mq}")
-                                    print(f"     {sig['reason']}")
-                                    size = min(MAX_POSITION_USDC, 15.0)
-                                    result, px, used_size = execute_buy(client, aid, sig["bid"], size)
-                                    if result and px:
-                                        shares = used_size / px
-                                        tracker.positions[aid] = {"entry_price": px, "size": shares, "entry_time": time.time(), "target": sig["ask"]}
-                                        print(f"     LIMIT BUY {shares:.2f} @ ${px:.4f}")
-                                        tracker.trades.append({"time": now_s, "type": "SPREAD_BUY", "market": mq, "price": px, "size": used_size})
-
-                                elif sig["type"] in ("TAKE_PROFIT", "STOP_LOSS"):
-                                    pos = tracker.positions.get(aid)
-                                    if pos:
-                                        tag = "PROFIT" if sig["type"] == "TAKE_PROFIT" else "STOP"
-                                        print(f"\n  {tag} [{now_s}] {mq}")
-                                        print(f"     {sig['reason']}")
-                                        result, px = execute_sell(client, aid, sig["exit_price"], pos["size"])
-                                        if result and px:
-                                            pnl = (px - pos["entry_price"]) * pos["size"]
-                                            tracker.pnl += pnl
-                                            print(f"     SOLD {pos['size']:.2f} @ ${px:.4f} | PnL: ${pnl:.4f} | Total: ${tracker.pnl:.4f}")
-                                            tracker.trades.append({"time": now_s, "type": "SELL", "market": mq, "pnl": pnl})
-                                            del tracker.positions[aid]
+                                mq = token_map.get(aid, {}).get("question", "?")[:50]
+                                side = "BUY" if sig["type"] in ENTRY_USDC else "SELL"
+                                blocked = risk.check(aid, side, ENTRY_USDC.get(sig["type"], 0.0))
+                                if blocked:
+                                    print(f"  {RISK_LIMIT_EXCEEDED} {sig['type']} {mq}: {blocked}")
+                                    continue
+                                # one order task per token: a duplicate signal while the first is in flight is dropped
+                                if not gateway.spawn(aid, handle_signal(rt, aid, sig, mq)):
+                                    break
+
+                            # resting quotes follow the book; skipped while an order task owns this token
+                            if not gateway.busy(aid) and orders.needs_requote(aid, best_bid, best_ask):
+                                gateway.spawn(aid, orders.requote(aid, best_bid, best_ask))
 
                     except json.JSONDecodeError:
                         continue
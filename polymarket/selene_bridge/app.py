@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 import os
+import sys
 import time
 import json
-import sqlite3
 from pathlib import Path
 from typing import Optional
 
@@ -16,6 +16,9 @@ try:
 except Exception:
     OpenAI = None
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sqlite_store import connect, execute, query
+
 DB_PATH = os.getenv("SELENE_DB_PATH", "/opt/polybot/rag/selene_chat.db")
 RAG_SOURCES_DIR = Path(os.getenv("RAG_SOURCES_DIR", "/opt/polybot/rag_sources"))
 MODEL = os.getenv("SELENE_MODEL", "gpt-5.3-codex")
@@ -150,9 +153,7 @@ setInterval(refreshAll, 4000);
 """
 
 
-def db():
-    Path(DB_PATH).parent.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(DB_PATH)
+def db_init(con):
     con.execute(
         """
         CREATE TABLE IF NOT EXISTS messages (
@@ -164,18 +165,19 @@ def db():
         )
         """
     )
-    con.commit()
-    return con
+
+
+def db():
+    return connect(DB_PATH, db_init)
 
 
 def log_msg(thread: str, author: str, content: str):
-    con = db()
-    con.execute(
+    execute(
+        DB_PATH,
         "INSERT INTO messages(ts_utc, thread, author, content) VALUES (?, ?, ?, ?)",
         (int(time.time()), thread, author, content),
+        schema=db_init,
     )
-    con.commit()
-    con.close()
 
     # also append to a RAG source file (simple, durable)
     RAG_SOURCES_DIR.mkdir(parents=True, exist_ok=True)
@@ -192,12 +194,8 @@ def selene_reply(user_text: str) -> str:
     client = OpenAI()
 
     # Build short context window from DB (last ~25 messages in selene thread)
-    con = db()
-    con.row_factory = sqlite3.Row
-    rows = con.execute(
-        "SELECT author, content FROM messages WHERE thread='selene' ORDER BY id DESC LIMIT 25"
-    ).fetchall()
-    con.close()
+    db()
+    rows = query(DB_PATH, "SELECT author, content FROM messages WHERE thread='selene' ORDER BY id DESC LIMIT 25")
 
     context = []
     for r in reversed(rows):
@@ -241,14 +239,13 @@ def info():
 
 @app.get("/history")
 def history(limit: int = 250):
-    con = db()
-    con.row_factory = sqlite3.Row
-    rows = con.execute(
+    db()
+    rows = query(
+        DB_PATH,
         "SELECT ts_utc, thread, author, content FROM messages WHERE thread='main' ORDER BY id DESC LIMIT ?",
         (limit,),
-    ).fetchall()
-    con.close()
-    out = [dict(r) for r in reversed(rows)]
+    )
+    out = list(reversed(rows))
     return JSONResponse({"rows": out})
 
 
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Shared SQLite access for the equity and chat stores.
+
+Every database is opened in WAL mode, so the collector writing and the servers reading the
+same file no longer block each other. Connections are long-lived (one per thread per path)
+and keep a statement cache, so repeated queries reuse their prepared statements instead of
+reconnecting and re-parsing. Schema setup runs once per process per path, not per call.
+
+`GroupCommit` batches writes: rows go into an open transaction that is committed once
+`max_rows` are pending or `max_delay_sec` has passed since the first of them. In WAL mode
+with synchronous=NORMAL a commit is a WAL append with no fsync, so durability across an OS
+crash is bounded by the last checkpoint; an application crash loses nothing committed.
+"""
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_KB', '16384'))}",  # negative = KiB
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_BYTES', str(64 * 1024 * 1024)))}",
+    f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}",
+    f"PRAGMA journal_size_limit={int(os.getenv('SQLITE_WAL_LIMIT_BYTES', str(64 * 1024 * 1024)))}",  # WAL shrinks back after checkpoints
+)
+STATEMENT_CACHE = 256
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()  # (path, schema) already applied in this process
+
+
+def connect(path, schema=None):
+    """Long-lived connection to `path` for the calling thread. `schema` is a callable taking
+    the connection (e.g. CREATE TABLE IF NOT EXISTS statements) and runs once per process."""
+    conns = _local.__dict__.setdefault("conns", {})
+    con = conns.get(path)
+    if con is None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        con = sqlite3.connect(path, timeout=30, cached_statements=STATEMENT_CACHE)
+        for pragma in PRAGMAS:
+            con.execute(pragma)
+        conns[path] = con
+    if schema is not None and (path, schema) not in _schema_ready:
+        with _schema_lock:
+            if (path, schema) not in _schema_ready:
+                schema(con)
+                con.commit()
+                _schema_ready.add((path, schema))
+    return con
+
+
+def use_incremental_vacuum(con):
+    """Switch `con`'s file to auto_vacuum=INCREMENTAL; an existing file needs one full VACUUM for it."""
+    if con.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        con.commit()
+        con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        con.execute("VACUUM")
+
+
+def incremental_vacuum(con, pages):
+    """Return up to `pages` free pages to the filesystem (needs use_incremental_vacuum). Runs via
+    executescript: the pragma frees one page per step and execute() only steps it once."""
+    con.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+
+
+def query(path, sql, args=()):
+    """Rows of `sql` as dicts, on this thread's connection to `path`."""
+    cur = connect(path).execute(sql, args)
+    cols = [d[0] for d in cur.description]
+    return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+
+def execute(path, sql, args=(), schema=None):
+    """One write in its own transaction; for low-rate writers (GroupCommit for streams of rows)."""
+    con = connect(path, schema)
+    with con:
+        return con.execute(sql, args).lastrowid
+
+
+class GroupCommit:
+    """Writes into one open transaction, committed per batch rather than per row."""
+
+    def __init__(self, con, max_rows=64, max_delay_sec=1.0):
+        self.con = con
+        self.max_rows = max_rows
+        self.max_delay_sec = max_delay_sec
+        self.pending = 0
+        self.first_at = None
+        self.commits = 0
+
+    def write(self, sql, args=()):
+        self.con.execute(sql, args)
+        self.pending += 1
+        if self.first_at is None:
+            self.first_at = time.monotonic()
+        if self.pending >= self.max_rows or time.monotonic() - self.first_at >= self.max_delay_sec:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.con.commit()
+            self.commits += 1
+        self.pending = 0
+        self.first_at = None
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "equity_terminal"))
+
+from server import downsample  # noqa: E402
+
+
+def series(n=2000, seed=1):
+    rng = np.random.default_rng(seed)
+    y = 100 + np.cumsum(rng.normal(0, 1, n))
+    return [{"ts_utc": i * 2, "equity_total_usd": float(v)} for i, v in enumerate(y)]
+
+
+def test_downsample_never_exceeds_max_points():
+    rows = series()
+    for max_points in range(3, 40):
+        assert len(downsample(rows, max_points)) <= max_points
+
+
+def test_downsample_keeps_drawdown_extremes():
+    rows = series()
+    y = np.array([r["equity_total_usd"] for r in rows])
+    out = np.array([r["equity_total_usd"] for r in downsample(rows, 200)])
+    dd = lambda a: (a - np.maximum.accumulate(a)).min()  # noqa: E731
+    assert out.max() == y.max()
+    assert out.min() == y.min()
+    assert dd(out) == dd(y)
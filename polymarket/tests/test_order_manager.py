@@ -0,0 +1,92 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from order_manager import FILLED, PARTIALLY_FILLED, OrderManager  # noqa: E402
+
+
+class FakeGateway:
+    def __init__(self, resp, before_ack=None):
+        self.resp = resp
+        self.before_ack = before_ack  # runs while the post is in flight (order still PENDING)
+
+    async def place(self, token_id, side, price, size):
+        if self.before_ack:
+            self.before_ack()
+        return self.resp
+
+
+def matched_ack(order_id, shares):
+    return {"success": True, "orderID": order_id, "status": "matched", "takingAmount": str(shares)}
+
+
+def fill(order_id, size, trade_id="t1"):
+    return {"trade_id": trade_id, "order_id": order_id, "token_id": "tok", "side": "BUY", "price": 0.5, "size": size}
+
+
+def test_ack_then_stream_counts_partial_match_once():
+    om = OrderManager(FakeGateway(matched_ack("o1", 4)))
+    asyncio.run(om.submit("tok", "BUY", 0.5, 10))
+    om.on_fill(fill("o1", 4))
+    o = om.orders["o1"]
+    assert o["filled"] == 4.0
+    assert o["state"] == PARTIALLY_FILLED
+    # a later trade is new volume
+    om.on_fill(fill("o1", 6, trade_id="t2"))
+    assert o["filled"] == 10.0
+    assert o["state"] == FILLED
+
+
+def test_stream_then_ack_counts_partial_match_once():
+    gw = FakeGateway(matched_ack("o1", 4))
+    om = OrderManager(gw)
+    gw.before_ack = lambda: om.on_fill(fill("o1", 4))
+    asyncio.run(om.submit("tok", "BUY", 0.5, 10))
+    assert om.orders["o1"]["filled"] == 4.0
+    assert "o1" not in om.ack_credit
+
+
+def test_ack_credit_covers_only_what_the_stream_has_not_reported():
+    gw = FakeGateway(matched_ack("o1", 6))
+    om = OrderManager(gw)
+    gw.before_ack = lambda: om.on_fill(fill("o1", 2))
+    asyncio.run(om.submit("tok", "BUY", 0.5, 10))
+    om.on_fill(fill("o1", 4, trade_id="t2"))  # the rest of the ack's match
+    assert om.orders["o1"]["filled"] == 6.0
+
+
+def test_replace_is_blocked_once_risk_trips():
+    from risk import RiskEngine
+
+    class CancelGateway(FakeGateway):
+        inflight = {}
+        client = type("C", (), {"cancel_orders": None})()
+
+        async def call(self, fn, ids):
+            return {"canceled": ids}
+
+    gw = CancelGateway({"success": True, "orderID": "o1", "status": "live"})
+    risk = RiskEngine()
+    om = OrderManager(gw, risk=risk)
+    asyncio.run(om.submit("tok", "BUY", 0.5, 10, tag="quote"))
+    risk.tripped = "test"
+    gw.resp = {"success": True, "orderID": "o2", "status": "live"}
+    assert asyncio.run(om.replace("o1", 0.51)) is None
+    assert om.active("tok") == []
+
+
+def test_requote_uses_the_token_tick():
+    class TickGateway(FakeGateway):
+        client = type("C", (), {"get_tick_size": staticmethod(lambda token_id: "0.001")})()
+
+        async def call(self, fn, *args):
+            return fn(*args)
+
+    om = OrderManager(TickGateway({"success": True, "orderID": "o1", "status": "live"}))
+    asyncio.run(om.submit("tok", "BUY", 0.5, 10, tag="quote"))
+    o = om.orders["o1"]
+    assert o["tick"] == 0.001
+    # crossing the ask steps back one 0.001 tick, not the 0.01 default
+    assert om.requote_target(o, 0.52, 0.505) == 0.504
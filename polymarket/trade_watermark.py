@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Per-token last-trade watermark.
+
+Kept current from market-channel `last_trade_price` events, so staleness is a dict lookup.
+Tokens the stream has not covered fall back to REST, incrementally: trades are fetched with
+`after=` set to the cached watermark (first lookup: the last LOOKBACK_SEC), never the full
+history again.
+"""
+import threading
+import time
+
+from py_clob_client.clob_types import TradeParams
+
+from market_channel import MarketChannel
+
+LOOKBACK_SEC = 6 * 3600
+
+
+def to_seconds(ts):
+    ts = int(float(ts or 0))
+    return ts // 1000 if ts > 10_000_000_000 else ts  # WS timestamps are in ms
+
+
+class TradeWatermarks(MarketChannel):
+    label = "TRADE WATERMARK STREAM"
+    thread_name = "trade-watermark"
+
+    def __init__(self):
+        super().__init__()
+        self.ts = {}  # token_id -> last match time (unix seconds)
+        self.streamed = set()  # tokens the stream is subscribed to
+        self.seeded = set()  # streamed tokens whose history was read once via REST since the last (re)connect
+        self.rest_calls = 0
+        self.lock = threading.Lock()
+
+    def update(self, token_id, ts):
+        ts = to_seconds(ts)
+        if ts <= 0:
+            return
+        with self.lock:
+            if ts > self.ts.get(token_id, 0):
+                self.ts[token_id] = ts
+
+    def handle(self, msg):
+        if msg.get("event_type") == "last_trade_price" and msg.get("asset_id"):
+            self.update(str(msg["asset_id"]), msg.get("timestamp") or time.time())
+
+    def get(self, token_id):
+        return self.ts.get(token_id, 0)
+
+    def last_trade_ts(self, client, token_id):
+        """Watermark for `token_id`; O(1) while the stream covers it, else an incremental REST read."""
+        if self.connected and token_id in self.seeded:
+            return self.get(token_id)
+        after = self.ts.get(token_id) or int(time.time()) - LOOKBACK_SEC
+        try:
+            self.rest_calls += 1
+            trades = client.get_trades(TradeParams(asset_id=str(token_id), after=after))
+        except Exception:
+            return self.get(token_id)
+        if self.connected and token_id in self.streamed:
+            self.seeded.add(token_id)
+        for t in trades if isinstance(trades, list) else []:
+            try:
+                self.update(token_id, t.get("match_time"))
+            except Exception:
+                pass
+        return self.get(token_id)
+
+    def on_connect(self, token_ids):
+        self.streamed = set(token_ids)
+        self.seeded = set()  # trades during the gap are unknown: re-read each token once